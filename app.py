@@ -1,126 +1,367 @@
 import os
+import sys
 import json
-import unicodedata
-import uuid
-import smtplib
-import ssl
-from datetime import datetime, timedelta
+import time
+import hashlib
+from datetime import datetime
 from urllib.parse import urlencode, quote
 from html import escape
-
-import pandas as pd
-from flask import Flask, request, render_template, redirect, session
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from itertools import chain
+from functools import partial, wraps
+
+try:
+    import resource
+except ImportError:  # Windows: sem getrusage, o relatório de inicialização sai sem a memória
+    resource = None
+
+# Início do carregamento do app, para o relatório de inicialização no fim deste arquivo.
+INICIO_CARREGAMENTO = time.perf_counter()
+
+from flask import (
+    Flask, Response, g, request, render_template, redirect, session, stream_with_context, make_response
+)
+
+import armazenamento
+import arquivo_tokens
+import compressao_http
+import ingestao
+import metricas
+import rotas_formulario
+import tokens_assinados
+from envio_email import obter_config_email
+from jobs_envio import executar_envio, iniciar_job
+from modelos_email import ModeloEmail
 
 app = Flask(__name__)
 app.secret_key = 'sistema-cadastro-secret-key-2024'
 
-TOKENS_FILE = os.path.join(os.path.dirname(__file__), "tokens.json")
-LEADER_TRACK_TOKENS_FILE = os.path.join(os.path.dirname(__file__), "leader_track_tokens.json")
-PORTAL_DESEMPENHO_USUARIOS_FILE = os.path.join(os.path.dirname(__file__), "portal_desempenho_usuarios.json")
 
+@app.before_request
+def iniciar_cronometro():
+    g.inicio_requisicao = time.perf_counter()
 
-def normalizar(texto):
-    return unicodedata.normalize('NFKD', str(texto)).encode('ASCII', 'ignore').decode('ASCII').strip().lower()
 
+@app.after_request
+def registrar_duracao(response):
+    # Em respostas em streaming, mede até o início do envio (o corpo sai depois).
+    inicio = g.pop("inicio_requisicao", None)
+    if inicio is not None:
+        metricas.observar(
+            "http_requisicao_duracao_segundos", time.perf_counter() - inicio,
+            rota=request.url_rule.rule if request.url_rule else "sem_rota",
+            metodo=request.method,
+            status=response.status_code
+        )
+    return response
+
+
+@app.after_request
+def comprimir_resposta(response):
+    return compressao_http.comprimir(response, request.accept_encodings)
+
+
+# Páginas estáticas (painel, formulários) podem ficar no cache do navegador por esse tempo.
+PAGINA_ESTATICA_MAX_AGE = int(os.environ.get("PAGINA_ESTATICA_MAX_AGE", "86400"))
+
+# Entra nas ETags das listagens para que um deploy com outro HTML não reaproveite as antigas.
+VERSAO_APP = os.environ.get("APP_VERSAO") or str(int(os.path.getmtime(__file__)))
+
+
+def pagina_estatica(view):
+    # Só o GET: o POST das mesmas rotas executa a ação e nunca vai para o cache.
+    @wraps(view)
+    def responder(*args, **kwargs):
+        resposta = make_response(view(*args, **kwargs))
+        if request.method == "GET" and resposta.status_code == 200:
+            resposta.cache_control.public = True
+            resposta.cache_control.max_age = PAGINA_ESTATICA_MAX_AGE
+            resposta.add_etag(weak=True)
+            resposta.make_conditional(request)
+        return resposta
+    return responder
+
+
+# Origens (outros domínios) cujas páginas podem chamar as APIs marcadas com @permitir_origens
+# pelo navegador; por padrão só o gestor, onde ficam os formulários. Separadas por vírgula.
+CORS_ORIGENS = {
+    origem.strip().rstrip("/")
+    for origem in os.environ.get("CORS_ORIGENS", rotas_formulario.URL_GESTOR).split(",")
+    if origem.strip()
+}
+
+
+def permitir_origens(view):
+    # CORS: responde o preflight (OPTIONS) sem executar a rota e devolve
+    # Access-Control-Allow-Origin só para as origens de CORS_ORIGENS. A rota precisa
+    # declarar OPTIONS em methods, senão o Flask responde o preflight sozinho.
+    @wraps(view)
+    def responder(*args, **kwargs):
+        preflight = request.method == "OPTIONS"
+        resposta = make_response("", 204) if preflight else make_response(view(*args, **kwargs))
+
+        origem = request.headers.get("Origin")
+        if origem in CORS_ORIGENS:
+            resposta.headers["Access-Control-Allow-Origin"] = origem
+            if preflight:
+                resposta.headers["Access-Control-Allow-Methods"] = ", ".join(sorted(request.url_rule.methods - {"HEAD"}))
+                resposta.headers["Access-Control-Allow-Headers"] = "Content-Type"
+                resposta.headers["Access-Control-Max-Age"] = "86400"
+        resposta.vary.add("Origin")
+        return resposta
+    return responder
+
+
+def condicional(tabela):
+    # Listagens: a ETag vem da versão da coleção no banco e da URL, então se nada foi gravado
+    # desde a última visita o cliente recebe 304 sem consulta nem renderização.
+    def decorador(view):
+        @wraps(view)
+        def responder(*args, **kwargs):
+            if "expirado" in request.args:
+                # Esse filtro depende do relógio, não só do que está gravado.
+                return view(*args, **kwargs)
+
+            versao, alterado_em = armazenamento.versao_colecao(tabela)
+            etag = hashlib.sha1(f"{VERSAO_APP}:{tabela}:{versao}:{request.full_path}".encode()).hexdigest()
+            if alterado_em is not None:
+                alterado_em = alterado_em.replace(microsecond=0)
+
+            if request.if_none_match:
+                inalterado = request.if_none_match.contains_weak(etag)
+            else:
+                inalterado = (
+                    alterado_em is not None
+                    and request.if_modified_since is not None
+                    and alterado_em <= request.if_modified_since
+                )
 
-def carregar_tokens():
-    if not os.path.exists(TOKENS_FILE):
-        with open(TOKENS_FILE, "w", encoding="utf-8") as f:
-            json.dump([], f, indent=2, ensure_ascii=False)
+            resposta = Response(status=304) if inalterado else make_response(view(*args, **kwargs))
+            resposta.set_etag(etag, weak=True)
+            resposta.last_modified = alterado_em
+            resposta.cache_control.no_cache = True
+            return resposta
+        return responder
+    return decorador
 
-    try:
-        with open(TOKENS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, list) and all(isinstance(item, dict) for item in data):
-                return data
-            else:
-                print("❌ ERRO: tokens.json não está no formato esperado.")
-                return []
-    except Exception as e:
-        print(f"❌ ERRO ao carregar tokens: {e}")
-        return []
+
+def carregar_tokens():
+    return armazenamento.carregar_registros("tokens")
 
 
 def salvar_tokens(tokens):
-    with open(TOKENS_FILE, "w", encoding="utf-8") as f:
-        json.dump(tokens, f, indent=2, ensure_ascii=False)
+    armazenamento.salvar_registros("tokens", tokens)
 
 
-def carregar_leader_track_tokens():
-    if not os.path.exists(LEADER_TRACK_TOKENS_FILE):
-        print(f"📁 Criando arquivo: {LEADER_TRACK_TOKENS_FILE}")
-        with open(LEADER_TRACK_TOKENS_FILE, "w", encoding="utf-8") as f:
-            json.dump([], f, indent=2, ensure_ascii=False)
+def buscar_token(token):
+    return armazenamento.buscar_registro("tokens", token)
 
-    try:
-        with open(LEADER_TRACK_TOKENS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            print(f"📥 Carregando tokens: {len(data)} tokens encontrados")
-            if isinstance(data, list) and all(isinstance(item, dict) for item in data):
-                return data
-            else:
-                print("❌ ERRO: leader_track_tokens.json não está no formato esperado.")
-                return []
-    except Exception as e:
-        print(f"❌ ERRO ao carregar leader track tokens: {e}")
-        return []
 
+def consumir_token(token, campos):
+    # Marca o token como usado só se ele ainda não foi usado nem expirou, de forma atômica
+    # entre workers: numa corrida, apenas uma requisição recebe o registro, a outra None.
+    return armazenamento.atualizar_se(
+        "tokens", token, {**campos, "usado": True},
+        "COALESCE(usado, '0') <> '1' AND (COALESCE(expira_em, '') = '' OR expira_em >= ?)",
+        [datetime.now().isoformat()],
+    )
 
-def salvar_leader_track_tokens(tokens):
-    with open(LEADER_TRACK_TOKENS_FILE, "w", encoding="utf-8") as f:
-        json.dump(tokens, f, indent=2, ensure_ascii=False)
 
+def carregar_leader_track_tokens():
+    tokens = armazenamento.carregar_registros("leader_track_tokens")
+    print(f"📥 Carregando tokens: {len(tokens)} tokens encontrados")
+    return tokens
 
-def carregar_portal_desempenho_usuarios():
-    if not os.path.exists(PORTAL_DESEMPENHO_USUARIOS_FILE):
-        print(f"📁 Criando arquivo: {PORTAL_DESEMPENHO_USUARIOS_FILE}")
-        with open(PORTAL_DESEMPENHO_USUARIOS_FILE, "w", encoding="utf-8") as f:
-            json.dump([], f, indent=2, ensure_ascii=False)
 
-    try:
-        with open(PORTAL_DESEMPENHO_USUARIOS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            print(f"📥 Carregando usuários do Portal de Desempenho: {len(data)} encontrados")
-            if isinstance(data, list) and all(isinstance(item, dict) for item in data):
-                return data
-            else:
-                print("❌ ERRO: portal_desempenho_usuarios.json não está no formato esperado.")
-                return []
-    except Exception as e:
-        print(f"❌ ERRO ao carregar usuários do Portal de Desempenho: {e}")
-        return []
+def salvar_leader_track_tokens(tokens):
+    armazenamento.salvar_registros("leader_track_tokens", tokens)
 
 
-def salvar_portal_desempenho_usuarios(usuarios):
-    with open(PORTAL_DESEMPENHO_USUARIOS_FILE, "w", encoding="utf-8") as f:
-        json.dump(usuarios, f, indent=2, ensure_ascii=False)
+def buscar_leader_track_token(token):
+    # Tokens assinados são resolvidos pela própria assinatura, sem passar pelo banco.
+    if tokens_assinados.eh_assinado(token):
+        return tokens_assinados.verificar(token)
+    return armazenamento.buscar_registro("leader_track_tokens", token)
 
 
-def ler_planilha_usuarios_portal(file):
-    nome_arquivo = (file.filename or "").lower()
+def carregar_portal_desempenho_usuarios():
+    usuarios = armazenamento.carregar_registros("portal_desempenho_usuarios")
+    print(f"📥 Carregando usuários do Portal de Desempenho: {len(usuarios)} encontrados")
+    return usuarios
 
-    if nome_arquivo.endswith(".csv"):
-        try:
-            return pd.read_csv(file, dtype=str, encoding="utf-8-sig").fillna("")
-        except UnicodeDecodeError:
-            file.seek(0)
-            return pd.read_csv(file, dtype=str, encoding="latin1").fillna("")
 
-    return pd.read_excel(file, dtype=str).fillna("")
+def salvar_portal_desempenho_usuarios(usuarios):
+    armazenamento.salvar_registros("portal_desempenho_usuarios", usuarios)
 
 
 def limpar_email(email):
     return str(email or "").strip().lower()
 
 
-def obter_config_email():
-    remetente = "marceloesteves@thehrkey.tech"
-    senha_remetente = "1Tub@r@o110368"
-    smtp_server = "smtp.titan.email"
-    porta = 587
-    return remetente, senha_remetente, smtp_server, porta
+# Os modelos são criados uma vez por envio (job): assunto, URLs fixas e rodapé já saem
+# renderizados, e cada mensagem só preenche os campos do destinatário.
+RODAPE_PROGRAMA = "The HR Key | Programa de Liderança de Alta Performance"
+PORTAL_CRIAR_SENHA_URL = "https://gestor.thehrkey.tech/wp-login.php?action=lostpassword"
+PORTAL_LOGIN_URL = "https://gestor.thehrkey.tech/wp-login.php?redirect_to=https%3A%2F%2Fgestor.thehrkey.tech%2Fmeu-portal-leadertrack%2F"
+
+
+def modelo_email_formulario():
+    return ModeloEmail(
+        "formulario", "🚀 Link de Acesso ao Formulário - The HR Key",
+        ["nome", "produto", "tipo", "url_final"], dias_validade=2, rodape=RODAPE_PROGRAMA
+    )
+
+
+def modelo_email_leadertrack():
+    return ModeloEmail(
+        "leadertrack", "🚀 Acesso ao LeaderTrack - The HR Key",
+        ["nome_lider", "empresa", "url_final"], rodape=RODAPE_PROGRAMA
+    )
+
+
+def modelo_email_portal():
+    return ModeloEmail(
+        "portal_desempenho", "Acesso ao Portal LeaderTrack - Avaliação de Desempenho",
+        ["nome", "email"],
+        criar_senha_url=PORTAL_CRIAR_SENHA_URL,
+        login_portal_url=PORTAL_LOGIN_URL,
+        rodape="The HR Key | LeaderTrack | Avaliação de Desempenho"
+    )
+
+
+def html_linhas_puladas(pulados):
+    if not pulados:
+        return ""
+
+    html = "<h3>⏭️ Linhas puladas</h3><ul style='font-family:monospace;'>"
+    for p in pulados:
+        html += f"<li>Linha {p['linha']}: {escape(p['chave'])} - {escape(p['motivo'])}</li>"
+    html += "</ul>"
+    return html
+
+
+def html_linhas_inseridas(linhas, campos):
+    if not linhas:
+        return ""
+
+    html = "<h3>🆕 Linhas inseridas</h3><ul style='font-family:monospace;'>"
+    for linha in linhas:
+        html += "<li>" + " / ".join(escape(str(linha.get(c, ""))) for c in campos) + "</li>"
+    html += "</ul>"
+    return html
+
+
+def iniciar_envio(tipo, alvo):
+    return redirect(f"/status-envio/{iniciar_job(tipo, alvo)}")
+
+
+# Filtros aceitos nas listagens (querystring) e o tipo de cada um.
+FILTROS_LISTAGEM = {
+    "tokens": {
+        "empresa": str, "codrodada": str, "produto": str, "usado": bool, "enviado": bool, "expirado": bool
+    },
+    "leader_track_tokens": {"empresa": str, "codrodada": str, "ativo": bool, "enviado": bool},
+    "portal_desempenho_usuarios": {"enviado": bool},
+}
+LISTAGEM_LIMITE_PADRAO = 100
+LISTAGEM_LIMITE_MAXIMO = 1000
+STATUS_ULTIMAS_LINHAS = 200
+LOG_ACOMPANHAR_INTERVALO = 1.0
+LOG_ACOMPANHAR_MAX_SEGUNDOS = float(os.environ.get("LOG_ACOMPANHAR_MAX_SEGUNDOS", "25"))
+
+
+def ler_booleano(valor):
+    return str(valor).strip().lower() in ("1", "true", "sim", "s", "yes")
+
+
+def ler_inteiro(valor, padrao):
+    try:
+        return max(int(valor), 0)
+    except (TypeError, ValueError):
+        return padrao
+
+
+def parametros_listagem(tabela):
+    filtros = {}
+    for nome, tipo in FILTROS_LISTAGEM[tabela].items():
+        valor = request.args.get(nome, "").strip()
+        if valor:
+            filtros[nome] = ler_booleano(valor) if tipo is bool else valor
+
+    limite = min(ler_inteiro(request.args.get("limite"), LISTAGEM_LIMITE_PADRAO) or 1, LISTAGEM_LIMITE_MAXIMO)
+    cursor = ler_inteiro(request.args.get("cursor"), 0)
+    offset = ler_inteiro(request.args.get("offset"), 0)
+    return filtros, limite, cursor, offset
+
+
+def pagina_listagem(tabela):
+    filtros, limite, cursor, offset = parametros_listagem(tabela)
+    registros, total, proximo_cursor = armazenamento.listar_pagina(tabela, filtros, limite, cursor, offset)
+    return {
+        "tabela": tabela,
+        "total": total,
+        "limite": limite,
+        "cursor": cursor,
+        "offset": offset,
+        "proximo_cursor": proximo_cursor,
+        "filtros": filtros,
+        "registros": registros
+    }
+
+
+def html_navegacao_listagem(pagina):
+    filtros = {k: ("1" if v is True else "0" if v is False else v) for k, v in pagina["filtros"].items()}
+    campos = "".join(
+        f"<label>{escape(nome)}: <input name='{escape(nome)}' value='{escape(str(filtros.get(nome, '')))}' size='12'></label> "
+        for nome in FILTROS_LISTAGEM[pagina["tabela"]]
+    )
+
+    html = (
+        f"<form method='get'>{campos}<input type='hidden' name='limite' value='{pagina['limite']}'>"
+        f"<input type='submit' value='Filtrar'></form>"
+        f"<p><strong>Total:</strong> {pagina['total']}"
+    )
+    if pagina["proximo_cursor"] is not None:
+        proxima = urlencode({**filtros, "limite": pagina["limite"], "cursor": pagina["proximo_cursor"]})
+        html += f" | <a href='?{escape(proxima)}'>Próxima página ➡️</a>"
+    if not pagina.get("todos"):
+        html += f" | <a href='?{escape(urlencode({**filtros, 'todos': 1}))}'>Ver todos</a>"
+    return html + "</p>"
+
+
+def responder_listagem(tabela, titulo, formatar_item):
+    # A resposta sai em partes: o cabeçalho primeiro e depois cada item assim que é lido.
+    # Com ?todos=1 a coleção filtrada inteira é percorrida em lotes, com memória constante.
+    if ler_booleano(request.args.get("todos", "")):
+        filtros, limite, _, _ = parametros_listagem(tabela)
+        pagina = {
+            "tabela": tabela,
+            "total": armazenamento.contar_registros(tabela, filtros),
+            "limite": limite,
+            "proximo_cursor": None,
+            "filtros": filtros,
+            "todos": True,
+            "registros": armazenamento.iterar_registros(tabela, filtros)
+        }
+    else:
+        pagina = pagina_listagem(tabela)
+
+    def gerar():
+        yield f"<h2>{titulo}</h2>" + html_navegacao_listagem(pagina) + "<ul style='font-family:monospace;'>"
+        for registro in pagina["registros"]:
+            yield formatar_item(registro)
+        yield "</ul>"
+
+    return Response(stream_with_context(gerar()), mimetype="text/html")
+
+
+def responder_api_listagem(tabela):
+    # ?formato=ndjson devolve todos os registros filtrados, um JSON por linha, em streaming.
+    if request.args.get("formato") != "ndjson":
+        return pagina_listagem(tabela)
+
+    filtros = parametros_listagem(tabela)[0]
+    linhas = (json.dumps(r, ensure_ascii=False) + "\n" for r in armazenamento.iterar_registros(tabela, filtros))
+    return Response(stream_with_context(linhas), mimetype="application/x-ndjson")
 
 
 @app.route("/")
@@ -131,8 +372,7 @@ def home():
 @app.route("/completar-cadastro")
 def completar_cadastro():
     token_recebido = request.args.get("token")
-    tokens = carregar_tokens()
-    usuario = next((t for t in tokens if t.get("token") == token_recebido), None)
+    usuario = buscar_token(token_recebido)
 
     if not usuario:
         return "❌ Token inválido ou não encontrado", 404
@@ -151,38 +391,25 @@ def finalizar_cadastro():
     idade = request.form.get("idade")
     cargo = request.form.get("cargo")
 
-    tokens = carregar_tokens()
-    usuario = next((t for t in tokens if t.get("token") == token_recebido), None)
+    usuario = consumir_token(token_recebido, {
+        "senha": senha,
+        "idade": idade,
+        "cargo": cargo
+    })
 
     if not usuario:
-        return "❌ Token inválido", 404
-
-    usuario["senha"] = senha
-    usuario["idade"] = idade
-    usuario["cargo"] = cargo
-    usuario["usado"] = True
-
-    salvar_tokens(tokens)
-
-    produto = normalizar(usuario.get("produto", ""))
-    tipo = normalizar(usuario.get("tipo", ""))
-
-    if produto == "arquetipos":
-        if tipo == "autoavaliacao":
-            url_base = "https://gestor.thehrkey.tech/form_arquetipos_autoaval"
-        elif tipo == "avaliacao equipe":
-            url_base = "https://gestor.thehrkey.tech/form_arquetipos"
-        else:
-            return f"⚠️ Tipo inválido para arquétipos: {tipo}", 400
-
-    elif produto == "microambiente":
-        if tipo in ["microambiente_equipe", "microambiente_autoavaliacao"]:
-            url_base = "https://gestor.thehrkey.tech/microambiente-de-equipes"
-        else:
-            return f"⚠️ Tipo inválido para microambiente: {tipo}", 400
+        atual = buscar_token(token_recebido)
+        if not atual:
+            return "❌ Token inválido", 404
+        if atual.get("usado"):
+            return "⚠️ Esse token já foi usado.", 403
+        return "⚠️ Esse token expirou.", 403
 
-    else:
-        return f"⚠️ Produto inválido: {produto}", 400
+    rota = rotas_formulario.rota_do_registro(usuario)
+    url_base = rota["url_base"]
+    if not url_base:
+        motivo, valor = rotas_formulario.erro_rota(rota)
+        return f"⚠️ {motivo.capitalize()}: {valor}", 400
 
     parametros = {
         "email": usuario.get("email", ""),
@@ -197,7 +424,12 @@ def finalizar_cadastro():
     return redirect(url_final)
 
 
+# Campos de cada linha inserida mostrados no relatório da mesclagem.
+CAMPOS_INSERIDOS_FORMULARIO = ("nome", "email", "codrodada", "produto", "tipo", "token")
+
+
 @app.route("/upload", methods=["GET", "POST"])
+@pagina_estatica
 def upload_excel():
     if request.method == "POST":
         file = request.files.get("file")
@@ -205,66 +437,115 @@ def upload_excel():
             return "❌ Nenhum arquivo enviado.", 400
 
         try:
-            df = pd.read_excel(file)
-            tokens = []
-
-            for _, row in df.iterrows():
-                token = {
-                    "nome": str(row.get("nome", "")).strip(),
-                    "email": str(row.get("email", "")).strip(),
-                    "empresa": str(row.get("company", "")).strip(),
-                    "codrodada": str(row.get("codrodada", "")).strip(),
-                    "produto": str(row.get("produto", "")).strip(),
-                    "tipo": str(row.get("tipo", "")).strip(),
-                    "nomeLider": str(row.get("nomeLider", "")).strip(),
-                    "emailLider": str(row.get("emailLider", "")).strip(),
-                    "token": uuid.uuid4().hex,
-                    "expira_em": (datetime.now() + timedelta(days=2)).isoformat(),
-                    "usado": False
+            # modo=mesclar mantém os tokens atuais (com usado/expira_em) e só acrescenta as
+            # linhas cuja chave (email, codrodada, produto, tipo) ainda não existe.
+            mesclar = request.values.get("modo") == "mesclar"
+            resultado = {"pulados": []}
+
+            existentes = set()
+            if mesclar:
+                existentes = {
+                    ingestao.chave_texto((limpar_email(email), *resto))
+                    for email, *resto in armazenamento.valores_colunas("tokens", ingestao.CHAVE_FORMULARIO)
                 }
-                tokens.append(token)
+            preparar = partial(ingestao.preparar_tokens_formulario, existentes=existentes)
+            novos = []
+
+            def blocos():
+                for registros in ingestao.preparar_em_blocos(
+                    ingestao.ler_planilha_em_blocos(file), preparar, set(), resultado
+                ):
+                    if mesclar:
+                        novos.extend({c: r[c] for c in CAMPOS_INSERIDOS_FORMULARIO} for r in registros)
+                    yield registros
+
+            # A planilha é lida sem travar o banco; na gravação as chaves são conferidas de novo,
+            # caso outro worker tenha inserido as mesmas nesse meio tempo.
+            concorrentes = []
+            inseridos = armazenamento.gravar_em_blocos(
+                "tokens", blocos(), substituir=not mesclar,
+                chave_unica=ingestao.CHAVE_FORMULARIO if mesclar else None, descartados=concorrentes
+            )
+
+            if concorrentes:
+                descartados = {r["token"] for r in concorrentes}
+                novos = [r for r in novos if r["token"] not in descartados]
+
+            mantidos = [p for p in resultado["pulados"] if p["motivo"] == "já existe no banco"]
+            duplicados = [p for p in resultado["pulados"] if p["motivo"] != "já existe no banco"]
+            relatorio = {
+                "modo": "mesclar" if mesclar else "substituir",
+                "inseridos": inseridos,
+                "mantidos": len(mantidos) + len(concorrentes),
+                "duplicados_na_planilha": len(duplicados),
+                "total_tokens": armazenamento.contar_registros("tokens"),
+                "linhas_puladas": resultado["pulados"]
+            }
+            if mesclar:
+                relatorio["linhas_inseridas"] = novos
 
-            salvar_tokens(tokens)
-            return f"✅ {len(tokens)} tokens gerados com sucesso e salvos no tokens.json."
+            if request.values.get("formato") == "json":
+                return relatorio
+
+            if not mesclar:
+                return (
+                    f"✅ {inseridos} tokens gerados com sucesso e salvos no banco de tokens."
+                    + (f"<br>⏭️ Linhas duplicadas ignoradas: {len(resultado['pulados'])}" if resultado["pulados"] else "")
+                )
+
+            # Os já existentes aparecem só na contagem: a página cresce com o que mudou, não com
+            # o tamanho da rodada (a lista completa continua no formato=json).
+            return (
+                f"✅ Mesclagem concluída: {inseridos} novos tokens gerados.<br>"
+                f"♻️ Já existentes (token e estado mantidos): {relatorio['mantidos']}<br>"
+                f"⏭️ Duplicados na planilha: {relatorio['duplicados_na_planilha']}<br>"
+                f"📦 Total de tokens: {relatorio['total_tokens']}"
+                + html_linhas_inseridas(novos, CAMPOS_INSERIDOS_FORMULARIO)
+                + html_linhas_puladas(duplicados)
+            )
 
         except Exception as e:
-            return f"❌ Erro ao processar o Excel: {e}", 500
+            return f"❌ Erro ao processar a planilha: {e}", 500
 
     return '''
     <!doctype html>
     <title>Upload Excel</title>
-    <h2>Upload de Planilha Excel para Gerar Tokens</h2>
+    <h2>Upload de Planilha Excel ou CSV para Gerar Tokens</h2>
     <form method="post" enctype="multipart/form-data">
-      <input type="file" name="file" accept=".xlsx">
+      <input type="file" name="file" accept=".csv,.xlsx">
+      <label><input type="checkbox" name="modo" value="mesclar"> Mesclar com os tokens atuais (só acrescenta quem ainda não tem token)</label>
       <input type="submit" value="Enviar">
     </form>
     '''
 
 
-@app.route("/listar-tokens")
-def listar_tokens():
-    tokens = carregar_tokens()
-    html = "<h2>✅ TOKENS GERADOS</h2><ul style='font-family:monospace;'>"
+@app.route("/api/tokens")
+@condicional("tokens")
+def api_listar_tokens():
+    return responder_api_listagem("tokens")
 
-    for t in tokens:
-        html += "<li>"
-        html += "<br>".join([
-            f"<b>Nome:</b> {t.get('nome', '')}",
-            f"<b>Email:</b> {t.get('email', '')}",
-            f"<b>Empresa:</b> {t.get('empresa', '')}",
-            f"<b>Produto:</b> {t.get('produto', '')}",
-            f"<b>Tipo:</b> {t.get('tipo', '')}",
-            f"<b>Token:</b> <code>{t.get('token', '')}</code>",
-            f"<b>Expira em:</b> {t.get('expira_em', '')}",
-            f"<b>Usado:</b> {t.get('usado', False)}"
-        ])
-        html += "</li><hr>"
 
-    html += "</ul>"
-    return html
+def item_token(t):
+    return "<li>" + "<br>".join([
+        f"<b>Nome:</b> {t.get('nome', '')}",
+        f"<b>Email:</b> {t.get('email', '')}",
+        f"<b>Empresa:</b> {t.get('empresa', '')}",
+        f"<b>Produto:</b> {t.get('produto', '')}",
+        f"<b>Tipo:</b> {t.get('tipo', '')}",
+        f"<b>Token:</b> <code>{t.get('token', '')}</code>",
+        f"<b>Expira em:</b> {t.get('expira_em', '')}",
+        f"<b>Usado:</b> {t.get('usado', False)}"
+    ]) + "</li><hr>"
+
+
+@app.route("/listar-tokens")
+@condicional("tokens")
+def listar_tokens():
+    return responder_listagem("tokens", "✅ TOKENS GERADOS", item_token)
 
 
 @app.route("/excluir-tokens", methods=["GET", "POST"])
+@pagina_estatica
 def excluir_tokens():
     if request.method == "POST":
         try:
@@ -283,142 +564,170 @@ def excluir_tokens():
     '''
 
 
-@app.route("/enviar-emails", methods=["GET"])
-def enviar_emails():
-    tokens = carregar_tokens()
+def preparar_email_formulario(i, usuario, remetente, logs, modelo):
+    nome = str(usuario.get("nome", "")).strip()
+    email = str(usuario.get("email", "")).strip()
+    rota = rotas_formulario.rota_do_registro(usuario)
+    produto = rota["produto_chave"]
+    tipo = rota["tipo_chave"]
+    token = str(usuario.get("token", "")).strip()
 
-    remetente, senha_remetente, smtp_server, porta = obter_config_email()
+    logs.append(f"--- Registro {i} ---")
+    logs.append(f"nome={nome}")
+    logs.append(f"email={email}")
+    logs.append(f"produto={produto}")
+    logs.append(f"tipo={tipo}")
+    logs.append(f"token={'ok' if token else 'vazio'}")
 
-    enviados = 0
-    pulados = 0
-    erros = 0
-    logs = []
+    if not nome or not email or not token:
+        logs.append("⏭️ Pulado: faltando nome, email ou token")
+        return None
 
-    logs.append(f"📦 Total de tokens carregados: {len(tokens)}")
-    logs.append(f"📨 Remetente configurado: {remetente}")
-    logs.append(f"🌐 SMTP: {smtp_server}:{porta}")
+    url_base = rota["url_base"]
+    if not url_base:
+        motivo, valor = rotas_formulario.erro_rota(rota)
+        logs.append(f"⏭️ Pulado: {motivo} -> {valor}")
+        return None
 
-    for i, usuario in enumerate(tokens, start=1):
-        try:
-            nome = str(usuario.get("nome", "")).strip()
-            email = str(usuario.get("email", "")).strip()
-            produto = normalizar(usuario.get("produto", ""))
-            tipo = normalizar(usuario.get("tipo", ""))
-            token = str(usuario.get("token", "")).strip()
-
-            logs.append(f"--- Registro {i} ---")
-            logs.append(f"nome={nome}")
-            logs.append(f"email={email}")
-            logs.append(f"produto={produto}")
-            logs.append(f"tipo={tipo}")
-            logs.append(f"token={'ok' if token else 'vazio'}")
-
-            if not nome or not email or not token:
-                logs.append("⏭️ Pulado: faltando nome, email ou token")
-                pulados += 1
-                continue
+    parametros = {
+        "company": usuario.get("empresa", ""),
+        "email": usuario.get("email", ""),
+        "codrodada": usuario.get("codrodada", ""),
+        "tipo": usuario.get("tipo", ""),
+        "nome": usuario.get("nome", ""),
+        "nomeLider": usuario.get("nomeLider", ""),
+        "emailLider": usuario.get("emailLider", "")
+    }
 
-            if produto == "arquetipos":
-                if tipo in ["autoavaliacao", "autoavaliacao "]:
-                    url_base = "https://gestor.thehrkey.tech/form_arquetipos_autoaval"
-                elif tipo in ["avaliacao equipe", "avaliacao de equipe"]:
-                    url_base = "https://gestor.thehrkey.tech/form_arquetipos"
-                else:
-                    logs.append(f"⏭️ Pulado: tipo inválido para arquétipos -> {tipo}")
-                    pulados += 1
-                    continue
+    query = "&".join(f"{k}={quote(str(v))}" for k, v in parametros.items())
+    url_final = f"{url_base}?{query}"
 
-            elif produto == "microambiente":
-                if tipo in ["microambiente_autoavaliacao", "microambiente autoavaliacao"]:
-                    url_base = "https://gestor.thehrkey.tech/microambiente-de-equipes"
-                elif tipo in ["microambiente_equipe", "microambiente equipe"]:
-                    url_base = "https://gestor.thehrkey.tech/microambiente-de-equipes"
-                else:
-                    logs.append(f"⏭️ Pulado: tipo inválido para microambiente -> {tipo}")
-                    pulados += 1
-                    continue
-            else:
-                logs.append(f"⏭️ Pulado: produto inválido -> {produto}")
-                pulados += 1
-                continue
+    msg = modelo.mensagem(
+        remetente, email, nome=nome, produto=produto.upper(), tipo=tipo.upper(), url_final=url_final
+    )
 
-            parametros = {
-                "company": usuario.get("empresa", ""),
-                "email": usuario.get("email", ""),
-                "codrodada": usuario.get("codrodada", ""),
-                "tipo": usuario.get("tipo", ""),
-                "nome": usuario.get("nome", ""),
-                "nomeLider": usuario.get("nomeLider", ""),
-                "emailLider": usuario.get("emailLider", "")
-            }
+    return email, msg
 
-            query = "&".join(f"{k}={quote(str(v))}" for k, v in parametros.items())
-            url_final = f"{url_base}?{query}"
-
-            assunto = "🚀 Link de Acesso ao Formulário - The HR Key"
-            corpo = f"""
-            <p>Olá, <strong>{nome}</strong>!</p>
-            <p>Segue o link de acesso ao formulário <strong>{produto.upper()} - {tipo.upper()}</strong>:</p>
-            <p><a href="{url_final}" target="_blank">{url_final}</a></p>
-            <p>⚠️ Este link é único, válido por 2 dias, e pode ser acessado apenas 1 vez.</p>
-            <hr>
-            <p style="font-size:12px;color:#777;">The HR Key | Programa de Liderança de Alta Performance</p>
-            """
-
-            msg = MIMEMultipart()
-            msg["From"] = f"The HR Key <{remetente}>"
-            msg["To"] = email
-            msg["Subject"] = assunto
-            msg.attach(MIMEText(corpo, "html"))
-
-            with smtplib.SMTP(smtp_server, porta) as server:
-                server.ehlo()
-                server.starttls(context=ssl.create_default_context())
-                server.ehlo()
-                server.login(remetente, senha_remetente)
-                server.sendmail(remetente, email, msg.as_string())
-
-            enviados += 1
-            logs.append(f"✅ Enviado com sucesso para {email}")
 
-        except Exception as e:
-            erros += 1
-            logs.append(f"❌ Erro ao enviar para {usuario.get('email', 'sem email')}: {str(e)}")
+@app.route("/enviar-emails", methods=["GET"])
+def enviar_emails():
+    reenviar = request.args.get("reenviar") == "1"
+
+    def alvo(job):
+        preparar = partial(preparar_email_formulario, modelo=modelo_email_formulario())
+        executar_envio(job, "tokens", preparar, obter_config_email(), reenviar)
+
+    return iniciar_envio("formularios", alvo)
+
 
-    resumo = f"✅ Enviados: {enviados} | ⏭️ Pulados: {pulados} | ❌ Erros: {erros} | 📦 Total: {len(tokens)}"
-    return f"<pre>{resumo}\n\n" + "\n".join(logs) + "</pre>"
+def url_leader_track(usuario):
+    email_lider = usuario.get("emailLider", "")
+    empresa = usuario.get("empresa", "")
+    codrodada = usuario.get("codrodada", "")
+
+    return (
+        f"https://gestor.thehrkey.tech/sistema-de-analise/"
+        f"?company={quote(str(empresa))}"
+        f"&codrodada={quote(str(codrodada))}"
+        f"&emaillider={quote(str(email_lider))}"
+        f"&token_validado=true"
+    )
 
 
 @app.route("/validar-token-leadertrack")
 def validar_token_leadertrack():
     try:
         token_recebido = request.args.get("token")
-        tokens = carregar_leader_track_tokens()
-        usuario = next((t for t in tokens if t.get("token") == token_recebido), None)
+        usuario = buscar_leader_track_token(token_recebido)
 
         if not usuario:
             return "❌ Token inválido ou não encontrado", 404
+        if not usuario.get("ativo", True):
+            return "⚠️ Esse token foi desativado.", 403
 
-        email_lider = usuario.get("emailLider", "")
-        empresa = usuario.get("empresa", "")
-        codrodada = usuario.get("codrodada", "")
-
-        url_leader_track = (
-            f"https://gestor.thehrkey.tech/sistema-de-analise/"
-            f"?company={quote(str(empresa))}"
-            f"&codrodada={quote(str(codrodada))}"
-            f"&emaillider={quote(str(email_lider))}"
-            f"&token_validado=true"
-        )
-
-        return redirect(url_leader_track)
+        return redirect(url_leader_track(usuario))
 
     except Exception as e:
         print(f"Erro na validação: {e}")
         return f"❌ Erro interno: {e}", 500
 
 
+VALIDACAO_MAXIMO_TOKENS = 1000
+
+
+def status_token_formulario(token, agora):
+    if not token:
+        return {"status": "desconhecido"}
+    if token.get("usado"):
+        status = "usado"
+    elif token.get("expira_em") and token["expira_em"] < agora:
+        status = "expirado"
+    else:
+        status = "valido"
+
+    rota = rotas_formulario.rota_do_registro(token)
+    return {
+        "status": status,
+        "expira_em": token.get("expira_em"),
+        "empresa": token.get("empresa", ""),
+        "codrodada": token.get("codrodada", ""),
+        "produto": rota["produto_chave"],
+        "tipo": rota["tipo_chave"],
+        "url_base": rota["url_base"],
+        "url_completar": f"/completar-cadastro?token={quote(str(token.get('token', '')))}"
+    }
+
+
+def status_token_leadertrack(token):
+    if not token:
+        return {"status": "desconhecido"}
+    ativo = token.get("ativo", True)
+    return {
+        "status": "valido" if ativo else "inativo",
+        "empresa": token.get("empresa", ""),
+        "codrodada": token.get("codrodada", ""),
+        "url": url_leader_track(token) if ativo else None
+    }
+
+
+@app.route("/api/validar-tokens", methods=["POST", "OPTIONS"])
+@permitir_origens
+def api_validar_tokens():
+    # Corpo: {"formulario": [tokens...], "leadertrack": [tokens...]}. Cada lista é resolvida
+    # com consultas em lote ao índice da coleção; a resposta traz o status de cada token
+    # (valido, usado, expirado, inativo ou desconhecido) e os dados de roteamento.
+    # Chamada direto do navegador pelas páginas do gestor (CORS_ORIGENS).
+    dados = request.get_json(silent=True)
+    if not isinstance(dados, dict):
+        return {"erro": "envie um JSON com as listas 'formulario' e/ou 'leadertrack'"}, 400
+
+    listas = {}
+    for tipo in ("formulario", "leadertrack"):
+        tokens = dados.get(tipo) or []
+        if not isinstance(tokens, list) or not all(isinstance(t, str) for t in tokens):
+            return {"erro": f"'{tipo}' deve ser uma lista de tokens (texto)"}, 400
+        listas[tipo] = list(dict.fromkeys(t.strip() for t in tokens))
+
+    if sum(len(tokens) for tokens in listas.values()) > VALIDACAO_MAXIMO_TOKENS:
+        return {"erro": f"no máximo {VALIDACAO_MAXIMO_TOKENS} tokens por requisição"}, 413
+
+    agora = datetime.now().isoformat()
+    formulario = armazenamento.buscar_registros("tokens", listas["formulario"])
+    leadertrack = armazenamento.buscar_registros(
+        "leader_track_tokens", [t for t in listas["leadertrack"] if not tokens_assinados.eh_assinado(t)]
+    )
+    for t in listas["leadertrack"]:
+        if tokens_assinados.eh_assinado(t):
+            leadertrack[t] = tokens_assinados.verificar(t)
+
+    return {
+        "formulario": {t: status_token_formulario(formulario.get(t), agora) for t in listas["formulario"]},
+        "leadertrack": {t: status_token_leadertrack(leadertrack.get(t)) for t in listas["leadertrack"]}
+    }
+
+
 @app.route("/upload-leadertrack", methods=["GET", "POST"])
+@pagina_estatica
 def upload_excel_leadertrack():
     if request.method == "POST":
         file = request.files.get("file")
@@ -426,87 +735,123 @@ def upload_excel_leadertrack():
             return "❌ Nenhum arquivo enviado.", 400
 
         try:
-            df = pd.read_excel(file)
-            tokens = carregar_leader_track_tokens()
+            # Por padrão um líder tem um único token; com chave=rodada, um por empresa/rodada.
+            por_rodada = request.values.get("chave") == "rodada"
+            chave = ingestao.CHAVE_LEADERTRACK_RODADA if por_rodada else [ingestao.CHAVE_LEADERTRACK]
 
-            for _, row in df.iterrows():
-                email_lider = str(row.get("emailLider", "")).strip()
-                token_existente = next((t for t in tokens if t.get("emailLider") == email_lider), None)
+            resultado = {"pulados": []}
+            novos = []
 
-                if token_existente:
-                    print(f"⚠️ Token já existe para {email_lider}, pulando...")
-                    continue
+            existentes = {
+                ingestao.chave_texto(valores[:-1] + (limpar_email(valores[-1]),))
+                for valores in armazenamento.valores_colunas("leader_track_tokens", chave)
+            }
+            preparar = partial(ingestao.preparar_tokens_leadertrack, existentes=existentes, chave=chave)
+
+            def blocos():
+                for registros in ingestao.preparar_em_blocos(
+                    ingestao.ler_planilha_em_blocos(file), preparar, set(), resultado
+                ):
+                    novos.extend(
+                        {c: r[c] for c in ("nomeLider", "emailLider", "empresa", "codrodada", "token")}
+                        for r in registros
+                    )
+                    yield registros
+
+            # Como em upload_excel: leitura sem travar o banco e chaves conferidas de novo na gravação.
+            concorrentes = []
+            inseridos = armazenamento.gravar_em_blocos(
+                "leader_track_tokens", blocos(), chave_unica=chave, descartados=concorrentes
+            )
+            if concorrentes:
+                descartados = {r["token"] for r in concorrentes}
+                novos = [r for r in novos if r["token"] not in descartados]
+
+            relatorio = {
+                "chave": " / ".join(chave),
+                "inseridos": inseridos,
+                "pulados": len(resultado["pulados"]) + len(concorrentes),
+                "total_tokens": armazenamento.contar_registros("leader_track_tokens"),
+                "linhas_inseridas": novos,
+                "linhas_puladas": resultado["pulados"]
+            }
 
-                email_envio = str(row.get("emailEnvio", "")).strip()
-                if not email_envio:
-                    email_envio = email_lider
-
-                token = {
-                    "nomeLider": str(row.get("nomeLider", "")).strip(),
-                    "emailLider": email_lider,
-                    "emailEnvio": email_envio,
-                    "empresa": str(row.get("company", "")).strip(),
-                    "codrodada": str(row.get("codrodada", "")).strip(),
-                    "token": uuid.uuid4().hex,
-                    "criado_em": datetime.now().isoformat(),
-                    "ativo": True
-                }
-                tokens.append(token)
+            if request.values.get("formato") == "json":
+                return relatorio
 
-            salvar_leader_track_tokens(tokens)
-            return f"✅ {len(tokens)} tokens LeaderTrack gerados com sucesso!"
+            html = (
+                f"✅ {inseridos} novos tokens LeaderTrack gerados com sucesso!<br>"
+                f"⏭️ Linhas puladas: {relatorio['pulados']}<br>"
+                f"🔑 Chave de duplicidade: {escape(relatorio['chave'])}<br>"
+                f"📦 Total de tokens LeaderTrack: {relatorio['total_tokens']}"
+            )
+            return html + html_linhas_puladas(resultado["pulados"])
 
         except Exception as e:
-            return f"❌ Erro ao processar o Excel: {e}", 500
+            return f"❌ Erro ao processar a planilha: {e}", 500
 
     return '''
     <!doctype html>
     <title>Upload Excel - LeaderTrack</title>
-    <h2>📊 Upload de Planilha Excel para Gerar Tokens LeaderTrack</h2>
+    <h2>📊 Upload de Planilha Excel ou CSV para Gerar Tokens LeaderTrack</h2>
     <p><strong>Formato esperado:</strong> nomeLider, emailLider, emailEnvio (opcional), company, codrodada</p>
     <p><em>Se não informar emailEnvio, será usado o emailLider como padrão</em></p>
     <form method="post" enctype="multipart/form-data">
-      <input type="file" name="file" accept=".xlsx" required>
+      <input type="file" name="file" accept=".csv,.xlsx" required>
+      <label><input type="checkbox" name="chave" value="rodada"> Um token por empresa/rodada (em vez de um por líder)</label>
       <input type="submit" value="Gerar Tokens LeaderTrack">
     </form>
     '''
 
 
-@app.route("/listar-tokens-leadertrack")
-def listar_tokens_leadertrack():
-    tokens = carregar_leader_track_tokens()
-    html = "<h2>✅ TOKENS LEADERTRACK GERADOS</h2><ul style='font-family:monospace;'>"
+@app.route("/api/tokens-leadertrack")
+@condicional("leader_track_tokens")
+def api_listar_tokens_leadertrack():
+    return responder_api_listagem("leader_track_tokens")
 
-    for t in tokens:
-        html += "<li>"
-        html += "<br>".join([
-            f"<b>Nome do Líder:</b> {t.get('nomeLider', '')}",
-            f"<b>Email do Líder:</b> {t.get('emailLider', '')}",
-            f"<b>Email de Envio:</b> {t.get('emailEnvio', t.get('emailLider', ''))}",
-            f"<b>Empresa:</b> {t.get('empresa', '')}",
-            f"<b>Rodada:</b> {t.get('codrodada', '')}",
-            f"<b>Token:</b> <code>{t.get('token', '')}</code>",
-            f"<b>Criado em:</b> {t.get('criado_em', '')}",
-            f"<b>Ativo:</b> {t.get('ativo', False)}"
-        ])
-        html += "</li><hr>"
 
-    html += "</ul>"
-    return html
+def item_token_leadertrack(t):
+    return "<li>" + "<br>".join([
+        f"<b>Nome do Líder:</b> {t.get('nomeLider', '')}",
+        f"<b>Email do Líder:</b> {t.get('emailLider', '')}",
+        f"<b>Email de Envio:</b> {t.get('emailEnvio', t.get('emailLider', ''))}",
+        f"<b>Empresa:</b> {t.get('empresa', '')}",
+        f"<b>Rodada:</b> {t.get('codrodada', '')}",
+        f"<b>Token:</b> <code>{t.get('token', '')}</code>",
+        f"<b>Criado em:</b> {t.get('criado_em', '')}",
+        f"<b>Ativo:</b> {t.get('ativo', False)}"
+    ]) + "</li><hr>"
+
+
+@app.route("/listar-tokens-leadertrack")
+@condicional("leader_track_tokens")
+def listar_tokens_leadertrack():
+    return responder_listagem("leader_track_tokens", "✅ TOKENS LEADERTRACK GERADOS", item_token_leadertrack)
 
 
 @app.route("/excluir-tokens-leadertrack", methods=["GET", "POST"])
+@pagina_estatica
 def excluir_tokens_leadertrack():
     if request.method == "POST":
         try:
-            salvar_leader_track_tokens([])
-            return "✅ Todos os tokens LeaderTrack foram excluídos com sucesso!"
+            if not tokens_assinados.habilitado():
+                salvar_leader_track_tokens([])
+                return "✅ Todos os tokens LeaderTrack foram excluídos com sucesso!"
+
+            # Links assinados não consultam o banco: os tokens apagados entram na lista de
+            # revogados, lote a lote, na mesma transação que os apaga.
+            total = armazenamento.extrair_registros(
+                "leader_track_tokens", "1 = 1", [],
+                lambda registros: tokens_assinados.revogar(r["token"] for r in registros)
+            )
+            return f"✅ Todos os tokens LeaderTrack foram excluídos com sucesso! 🚫 Links assinados revogados: {total}"
         except Exception as e:
             return f"❌ Erro ao excluir os tokens: {e}"
 
     return '''
         <h2>Confirmação de Exclusão - LeaderTrack</h2>
         <p style="color:red;"><strong>ATENÇÃO:</strong> Esta ação vai apagar <u>todos</u> os tokens LeaderTrack salvos. Isso é irreversível.</p>
+        <p>Os links assinados desses tokens também deixam de funcionar (entram na lista de revogados).</p>
         <form method="post">
             <button type="submit" style="padding:10px 20px; background:red; color:white; border:none; border-radius:8px;">Excluir TODOS os tokens LeaderTrack</button>
         </form>
@@ -514,134 +859,121 @@ def excluir_tokens_leadertrack():
     '''
 
 
-@app.route("/enviar-emails-leadertrack", methods=["GET"])
-def enviar_emails_leadertrack():
-    tokens = carregar_leader_track_tokens()
-    enviados = 0
-    erros = 0
-    logs = []
-
-    remetente, senha_remetente, smtp_server, porta = obter_config_email()
+@app.route("/revogar-tokens-leadertrack", methods=["GET", "POST"])
+@pagina_estatica
+def revogar_tokens_leadertrack():
+    # Aceita os ids dos tokens ou os próprios tokens assinados, separados por espaço, vírgula ou linha.
+    if request.method == "POST":
+        ids = []
+        invalidos = []
+        for token in request.values.get("tokens", "").replace(",", " ").split():
+            if tokens_assinados.eh_assinado(token):
+                registro = tokens_assinados.verificar(token)
+                if not registro:
+                    invalidos.append(token)
+                    continue
+                token = registro["token"]
+            ids.append(token)
 
-    logs.append(f"📦 Total de tokens LeaderTrack carregados: {len(tokens)}")
-    logs.append(f"📨 Remetente configurado: {remetente}")
-    logs.append(f"🌐 SMTP: {smtp_server}:{porta}")
+        if not ids:
+            return "❌ Nenhum token válido informado.", 400
 
-    for i, usuario in enumerate(tokens, start=1):
         try:
-            nome_lider = usuario.get("nomeLider")
-            email_lider = usuario.get("emailLider")
-            email_envio = usuario.get("emailEnvio", email_lider)
-            empresa = usuario.get("empresa")
-            token = usuario.get("token")
-
-            logs.append(f"--- Registro LeaderTrack {i} ---")
-            logs.append(f"nomeLider={nome_lider}")
-            logs.append(f"emailEnvio={email_envio}")
-            logs.append(f"empresa={empresa}")
-            logs.append(f"token={'ok' if token else 'vazio'}")
-
-            if not nome_lider or not email_lider or not token:
-                logs.append("⏭️ Pulado: faltando nomeLider, emailLider ou token")
-                continue
+            novos = tokens_assinados.revogar(ids)
+            desativados = armazenamento.atualizar_registros(
+                "leader_track_tokens", [(token_id, {"ativo": False}) for token_id in dict.fromkeys(ids)]
+            )
+        except Exception as e:
+            return f"❌ Erro ao revogar os tokens: {e}", 500
+
+        resultado = {
+            "revogados": len(novos),
+            "ja_revogados": len(set(ids)) - len(novos),
+            "desativados_no_banco": sum(1 for r in desativados if r),
+            "invalidos": invalidos
+        }
+        if request.values.get("formato") == "json":
+            return resultado
+        return (
+            f"✅ Tokens revogados: {resultado['revogados']}<br>"
+            f"♻️ Já estavam revogados: {resultado['ja_revogados']}<br>"
+            f"🗂️ Marcados como inativos no banco: {resultado['desativados_no_banco']}"
+            + (f"<br>❌ Tokens assinados inválidos: {len(invalidos)}" if invalidos else "")
+        )
 
-            url_final = f"https://sistema-cadastro-flask.onrender.com/validar-token-leadertrack?token={quote(str(token))}"
-
-            assunto = "🚀 Acesso ao LeaderTrack - The HR Key"
-            corpo = f"""
-            <p>Olá, <strong>{nome_lider}</strong>!</p>
-            <p>Você tem acesso ao <strong>LeaderTrack</strong> - Sistema de Análise de Liderança!</p>
-            <p><strong>Empresa:</strong> {empresa}</p>
-            <p><strong>Link de Acesso:</strong></p>
-            <p><a href="{url_final}" target="_blank" style="padding:12px 24px; background:#007bff; color:white; text-decoration:none; border-radius:8px; display:inline-block;">🎯 Acessar LeaderTrack</a></p>
-            <p><strong>Ou copie este link:</strong></p>
-            <p style="background:#f5f5f5; padding:10px; border-radius:5px; font-family:monospace;">{url_final}</p>
-            <p>✅ Este link é permanente e pode ser usado quantas vezes quiser.</p>
-            <p>Você terá acesso a todos os seus relatórios e análises de liderança.</p>
-            <hr>
-            <p style="font-size:12px;color:#777;">The HR Key | Programa de Liderança de Alta Performance</p>
-            """
-
-            msg = MIMEMultipart()
-            msg["From"] = f"The HR Key <{remetente}>"
-            msg["To"] = email_envio
-            msg["Subject"] = assunto
-            msg.attach(MIMEText(corpo, "html"))
-
-            with smtplib.SMTP(smtp_server, porta) as server:
-                server.ehlo()
-                server.starttls(context=ssl.create_default_context())
-                server.ehlo()
-                server.login(remetente, senha_remetente)
-                server.sendmail(remetente, email_envio, msg.as_string())
-
-            enviados += 1
-            logs.append(f"✅ Email LeaderTrack enviado para {email_envio}")
+    return '''
+        <h2>Revogar Tokens LeaderTrack</h2>
+        <p>Informe os tokens (ou os links assinados) que devem deixar de funcionar, um por linha.</p>
+        <form method="post">
+            <textarea name="tokens" rows="10" cols="80"></textarea><br>
+            <button type="submit" style="padding:10px 20px; background:red; color:white; border:none; border-radius:8px;">Revogar</button>
+        </form>
+        <p><a href="/listar-tokens-leadertrack">Voltar</a></p>
+    '''
 
-        except Exception as e:
-            erros += 1
-            logs.append(f"❌ Erro ao enviar para {usuario.get('emailEnvio', 'sem email')}: {str(e)}")
 
-    resumo = f"✅ E-mails LeaderTrack enviados com sucesso: {enviados} | ❌ Erros: {erros} | 📦 Total: {len(tokens)}"
-    return f"<pre>{resumo}\n\n" + "\n".join(logs) + "</pre>"
+def preparar_email_leadertrack(i, usuario, remetente, logs, modelo):
+    nome_lider = usuario.get("nomeLider")
+    email_lider = usuario.get("emailLider")
+    email_envio = usuario.get("emailEnvio", email_lider)
+    empresa = usuario.get("empresa")
+    token = usuario.get("token")
 
+    logs.append(f"--- Registro LeaderTrack {i} ---")
+    logs.append(f"nomeLider={nome_lider}")
+    logs.append(f"emailEnvio={email_envio}")
+    logs.append(f"empresa={empresa}")
+    logs.append(f"token={'ok' if token else 'vazio'}")
 
-@app.route("/upload-portal-desempenho", methods=["GET", "POST"])
-def upload_portal_desempenho():
-    if request.method == "POST":
-        file = request.files.get("file")
-        if not file:
-            return "❌ Nenhum arquivo enviado.", 400
+    if not nome_lider or not email_lider or not token:
+        logs.append("⏭️ Pulado: faltando nomeLider, emailLider ou token")
+        return None
 
-        try:
-            df = ler_planilha_usuarios_portal(file)
+    # Com LEADERTRACK_CHAVES configurada o link leva o token assinado, validado sem o banco.
+    token_link = tokens_assinados.assinar(usuario) if tokens_assinados.habilitado() else token
+    url_final = f"https://sistema-cadastro-flask.onrender.com/validar-token-leadertrack?token={quote(str(token_link))}"
 
-            colunas = set(df.columns)
-            if "user_email" not in colunas and "email" not in colunas:
-                return "❌ A planilha precisa ter a coluna user_email ou email.", 400
+    msg = modelo.mensagem(remetente, email_envio, nome_lider=nome_lider, empresa=empresa, url_final=url_final)
 
-            usuarios = []
-            emails_vistos = set()
-            pulados = 0
+    return email_envio, msg
 
-            for _, row in df.iterrows():
-                email = limpar_email(row.get("user_email", row.get("email", "")))
 
-                if not email or "@" not in email:
-                    pulados += 1
-                    continue
+@app.route("/enviar-emails-leadertrack", methods=["GET"])
+def enviar_emails_leadertrack():
+    reenviar = request.args.get("reenviar") == "1"
 
-                if email in emails_vistos:
-                    pulados += 1
-                    continue
+    def alvo(job):
+        preparar = partial(preparar_email_leadertrack, modelo=modelo_email_leadertrack())
+        executar_envio(job, "leader_track_tokens", preparar, obter_config_email(), reenviar)
 
-                emails_vistos.add(email)
+    return iniciar_envio("leadertrack", alvo)
 
-                first_name = str(row.get("first_name", "")).strip()
-                display_name = str(row.get("display_name", "")).strip()
 
-                if not display_name:
-                    display_name = first_name or email.split("@")[0]
+@app.route("/upload-portal-desempenho", methods=["GET", "POST"])
+@pagina_estatica
+def upload_portal_desempenho():
+    if request.method == "POST":
+        file = request.files.get("file")
+        if not file:
+            return "❌ Nenhum arquivo enviado.", 400
 
-                if not first_name:
-                    first_name = display_name.split(" ")[0] if display_name else "Olá"
+        try:
+            blocos = ingestao.ler_planilha_em_blocos(file)
+            primeiro = next(blocos, None)
 
-                usuarios.append({
-                    "user_email": email,
-                    "first_name": first_name,
-                    "display_name": display_name,
-                    "carregado_em": datetime.now().isoformat(),
-                    "enviado": False,
-                    "enviado_em": None,
-                    "erro": None
-                })
+            if primeiro is None or ("user_email" not in primeiro.columns and "email" not in primeiro.columns):
+                return "❌ A planilha precisa ter a coluna user_email ou email.", 400
 
-            salvar_portal_desempenho_usuarios(usuarios)
+            resultado = {"pulados": []}
+            blocos = ingestao.preparar_em_blocos(
+                chain([primeiro], blocos), ingestao.preparar_usuarios_portal, set(), resultado
+            )
+            total = armazenamento.gravar_em_blocos("portal_desempenho_usuarios", blocos, substituir=True)
 
             return (
                 f"✅ Lista do Portal de Desempenho carregada com sucesso!<br>"
-                f"📦 Usuários válidos carregados: {len(usuarios)}<br>"
-                f"⏭️ Registros pulados: {pulados}<br><br>"
+                f"📦 Usuários válidos carregados: {total}<br>"
+                f"⏭️ Registros pulados: {len(resultado['pulados'])}<br><br>"
                 f"<a href='/listar-usuarios-portal-desempenho'>Ver usuários carregados</a>"
             )
 
@@ -661,32 +993,34 @@ def upload_portal_desempenho():
     """
 
 
-@app.route("/listar-usuarios-portal-desempenho")
-def listar_usuarios_portal_desempenho():
-    usuarios = carregar_portal_desempenho_usuarios()
+@app.route("/api/usuarios-portal-desempenho")
+@condicional("portal_desempenho_usuarios")
+def api_listar_usuarios_portal_desempenho():
+    return responder_api_listagem("portal_desempenho_usuarios")
 
-    html = "<h2>✅ USUÁRIOS CARREGADOS - PORTAL DE AVALIAÇÃO DE DESEMPENHO</h2>"
-    html += f"<p><strong>Total:</strong> {len(usuarios)}</p>"
-    html += "<ul style='font-family:monospace;'>"
 
-    for u in usuarios:
-        status_envio = "✅ Enviado" if u.get("enviado") else "⏳ Pendente"
-        erro = u.get("erro") or ""
-        html += "<li>"
-        html += "<br>".join([
-            f"<b>Nome:</b> {escape(str(u.get('display_name', '')))}",
-            f"<b>Email:</b> {escape(str(u.get('user_email', '')))}",
-            f"<b>Status:</b> {status_envio}",
-            f"<b>Enviado em:</b> {escape(str(u.get('enviado_em') or ''))}",
-            f"<b>Erro:</b> {escape(str(erro))}"
-        ])
-        html += "</li><hr>"
+def item_usuario_portal(u):
+    status_envio = "✅ Enviado" if u.get("enviado") else "⏳ Pendente"
+    erro = u.get("erro") or ""
+    return "<li>" + "<br>".join([
+        f"<b>Nome:</b> {escape(str(u.get('display_name', '')))}",
+        f"<b>Email:</b> {escape(str(u.get('user_email', '')))}",
+        f"<b>Status:</b> {status_envio}",
+        f"<b>Enviado em:</b> {escape(str(u.get('enviado_em') or ''))}",
+        f"<b>Erro:</b> {escape(str(erro))}"
+    ]) + "</li><hr>"
 
-    html += "</ul>"
-    return html
+
+@app.route("/listar-usuarios-portal-desempenho")
+@condicional("portal_desempenho_usuarios")
+def listar_usuarios_portal_desempenho():
+    return responder_listagem(
+        "portal_desempenho_usuarios", "✅ USUÁRIOS CARREGADOS - PORTAL DE AVALIAÇÃO DE DESEMPENHO", item_usuario_portal
+    )
 
 
 @app.route("/excluir-usuarios-portal-desempenho", methods=["GET", "POST"])
+@pagina_estatica
 def excluir_usuarios_portal_desempenho():
     if request.method == "POST":
         try:
@@ -705,125 +1039,203 @@ def excluir_usuarios_portal_desempenho():
     """
 
 
+def preparar_email_portal(i, usuario, remetente, logs, modelo):
+    nome = str(usuario.get("first_name") or usuario.get("display_name") or "Olá").strip()
+    nome_completo = str(usuario.get("display_name") or nome).strip()
+    email = limpar_email(usuario.get("user_email", ""))
+
+    logs.append(f"--- Registro Portal {i} ---")
+    logs.append(f"nome={nome_completo}")
+    logs.append(f"email={email}")
+
+    if not email or "@" not in email:
+        logs.append("⏭️ Pulado: e-mail inválido")
+        return None
+
+    msg = modelo.mensagem(remetente, email, nome=escape(nome), email=escape(email))
+
+    return email, msg
+
+
 @app.route("/enviar-emails-portal-desempenho", methods=["GET"])
 def enviar_emails_portal_desempenho():
-    usuarios = carregar_portal_desempenho_usuarios()
+    reenviar = request.args.get("reenviar") == "1"
+
+    def alvo(job):
+        preparar = partial(preparar_email_portal, modelo=modelo_email_portal())
+        executar_envio(job, "portal_desempenho_usuarios", preparar, obter_config_email(), reenviar)
+
+    return iniciar_envio("portal_desempenho", alvo)
+
+
+@app.route("/status-envio/<job_id>")
+def status_envio(job_id):
+    job = armazenamento.obter_job(job_id)
+    if not job:
+        return "❌ Job de envio não encontrado", 404
+
+    job["restantes"] = max(job["total"] - job["enviados"] - job["pulados"] - job["erros"], 0)
+
+    if request.args.get("formato") == "json":
+        return job
+
+    em_andamento = job["status"] in ("na fila", "executando")
+    # A página mostra só as últimas linhas; o log completo sai em streaming em /logs.
+    logs = "\n".join(linha for _, linha in armazenamento.ultimos_logs_job(job_id, STATUS_ULTIMAS_LINHAS))
+    resumo = job["resumo"] or (
+        f"✅ Enviados: {job['enviados']} | ⏭️ Pulados: {job['pulados']} | ❌ Erros: {job['erros']} | "
+        f"⏳ Restantes: {job['restantes']} | 📦 Total: {job['total']}"
+    )
+
+    return (
+        ('<meta http-equiv="refresh" content="3">' if em_andamento else "")
+        + f"<h2>📬 Envio {escape(job['tipo'])} - {escape(job['id'])}</h2>"
+        + f"<p><strong>Status:</strong> {escape(job['status'])} | <strong>Atualizado em:</strong> {escape(job['atualizado_em'])}</p>"
+        + f"<p><a href='/status-envio/{escape(job['id'])}?formato=json'>JSON</a> | "
+        + f"<a href='/status-envio/{escape(job['id'])}/logs?acompanhar=1'>📜 Log completo (ao vivo)</a> | "
+        + "<a href='/jobs-envio'>Todos os envios</a></p>"
+        + f"<pre>{escape(resumo)}\n\n{escape(logs)}</pre>"
+    )
+
+
+@app.route("/status-envio/<job_id>/logs")
+def logs_envio(job_id):
+    # Log do job em texto puro e em streaming, lido do banco em lotes. Com ?acompanhar=1
+    # as linhas novas são enviadas à medida que o job as grava, até ele terminar ou até
+    # LOG_ACOMPANHAR_MAX_SEGUNDOS (o worker não fica preso); ?apos=<seq> retoma dali.
+    if not armazenamento.obter_job(job_id):
+        return "❌ Job de envio não encontrado", 404
+
+    acompanhar = request.args.get("acompanhar") == "1"
+    apos = ler_inteiro(request.args.get("apos"), 0) - 1
+
+    def gerar():
+        seq = apos
+        limite = time.monotonic() + LOG_ACOMPANHAR_MAX_SEGUNDOS
+        while True:
+            linhas = armazenamento.logs_job(job_id, seq)
+            if linhas:
+                seq = linhas[-1][0]
+                yield "".join(linha + "\n" for _, linha in linhas)
+                continue
 
-    remetente, senha_remetente, smtp_server, porta = obter_config_email()
+            job = armazenamento.obter_job(job_id)
+            if not acompanhar or job["status"] not in ("na fila", "executando"):
+                if job["resumo"]:
+                    yield f"\n{job['resumo']}\n"
+                return
+            if time.monotonic() >= limite:
+                yield f"\n⏳ Envio em andamento; continue em /status-envio/{job_id}/logs?acompanhar=1&apos={seq + 1}\n"
+                return
+            time.sleep(LOG_ACOMPANHAR_INTERVALO)
 
-    enviados = 0
-    pulados = 0
-    erros = 0
-    logs = []
+    return Response(stream_with_context(gerar()), mimetype="text/plain; charset=utf-8")
+
+
+@app.route("/jobs-envio")
+def listar_jobs_envio():
+    jobs = armazenamento.listar_jobs()
+
+    html = "<h2>📬 ENVIOS DE E-MAIL</h2><ul style='font-family:monospace;'>"
+    for job in jobs:
+        html += "<li>"
+        html += "<br>".join([
+            f"<b>Job:</b> <a href='/status-envio/{escape(job['id'])}'>{escape(job['id'])}</a>",
+            f"<b>Tipo:</b> {escape(job['tipo'])}",
+            f"<b>Status:</b> {escape(job['status'])}",
+            f"<b>Enviados/Pulados/Erros/Total:</b> {job['enviados']}/{job['pulados']}/{job['erros']}/{job['total']}",
+            f"<b>Criado em:</b> {escape(job['criado_em'])}"
+        ])
+        html += "</li><hr>"
 
-    portal_url = "https://gestor.thehrkey.tech/meu-portal-leadertrack/"
-    criar_senha_url = "https://gestor.thehrkey.tech/wp-login.php?action=lostpassword"
-    login_portal_url = "https://gestor.thehrkey.tech/wp-login.php?redirect_to=https%3A%2F%2Fgestor.thehrkey.tech%2Fmeu-portal-leadertrack%2F"
+    html += "</ul>"
+    return html
 
-    logs.append(f"📦 Total de usuários carregados: {len(usuarios)}")
-    logs.append(f"📨 Remetente configurado: {remetente}")
-    logs.append(f"🌐 SMTP: {smtp_server}:{porta}")
 
-    for i, usuario in enumerate(usuarios, start=1):
+@app.route("/compactar-tokens", methods=["GET", "POST"])
+@pagina_estatica
+def compactar_tokens():
+    if request.method == "POST":
         try:
-            nome = str(usuario.get("first_name") or usuario.get("display_name") or "Olá").strip()
-            nome_completo = str(usuario.get("display_name") or nome).strip()
-            email = limpar_email(usuario.get("user_email", ""))
+            resultado = arquivo_tokens.compactar()
+        except Exception as e:
+            return f"❌ Erro ao compactar os tokens: {e}", 500
+
+        if request.values.get("formato") == "json":
+            return resultado
+        return (
+            f"✅ Compactação concluída!<br>"
+            f"🗄️ Tokens de formulários arquivados (usados ou expirados): {resultado['tokens']}<br>"
+            f"🗄️ Tokens LeaderTrack arquivados (inativos): {resultado['leader_track_tokens']}<br>"
+            f"<a href='/arquivo-tokens'>Ver arquivo morto</a>"
+        )
 
-            logs.append(f"--- Registro Portal {i} ---")
-            logs.append(f"nome={nome_completo}")
-            logs.append(f"email={email}")
+    return '''
+        <h2>Compactação dos Tokens</h2>
+        <p>Move os tokens de formulários <strong>usados ou expirados</strong> e os tokens LeaderTrack
+        <strong>inativos</strong> para o arquivo morto (um arquivo comprimido por rodada).</p>
+        <p>Os registros arquivados continuam disponíveis para consulta em <a href="/arquivo-tokens">/arquivo-tokens</a>.</p>
+        <form method="post">
+            <button type="submit" style="padding:10px 20px; background:#ffc107; border:none; border-radius:8px;">Compactar agora</button>
+        </form>
+    '''
 
-            if usuario.get("enviado"):
-                logs.append("⏭️ Pulado: e-mail já marcado como enviado anteriormente")
-                pulados += 1
-                continue
 
-            if not email or "@" not in email:
-                logs.append("⏭️ Pulado: e-mail inválido")
-                pulados += 1
-                continue
+@app.route("/arquivo-tokens")
+def listar_arquivo_tokens():
+    html = (
+        "<h2>🗄️ ARQUIVO MORTO DE TOKENS</h2>"
+        "<form method='get' action='/arquivo-tokens/consultar'>"
+        "<select name='tabela'><option value='tokens'>tokens</option>"
+        "<option value='leader_track_tokens'>leader_track_tokens</option></select> "
+        "<label>codrodada: <input name='codrodada' size='12'></label> "
+        "<label>token: <input name='token' size='12'></label> "
+        "<label>email: <input name='email' size='12'></label> "
+        "<label>emailLider: <input name='emailLider' size='12'></label> "
+        "<input type='submit' value='Consultar'></form>"
+        "<ul style='font-family:monospace;'>"
+    )
+    for arquivo in arquivo_tokens.listar_arquivos():
+        consulta = urlencode({"tabela": arquivo["tabela"], "codrodada": arquivo["rodada"]})
+        html += (
+            f"<li>{escape(arquivo['tabela'])} / <a href='/arquivo-tokens/consultar?{escape(consulta)}'>"
+            f"{escape(arquivo['rodada'])}</a> ({arquivo['bytes']} bytes)</li>"
+        )
+    return html + "</ul>"
 
-            assunto = "Acesso ao Portal LeaderTrack - Avaliação de Desempenho"
-
-            corpo = f"""
-            <div style="font-family:Arial,sans-serif; color:#1f2937; line-height:1.6;">
-              <p>Olá, <strong>{escape(nome)}</strong>!</p>
-
-              <p>Seu acesso ao <strong>Portal LeaderTrack</strong> já está disponível.</p>
-
-              <p><strong>Para acessar pela primeira vez:</strong></p>
-
-              <ol>
-                <li>Use como <strong>usuário</strong> o seu próprio e-mail cadastrado: <strong>{escape(email)}</strong>.</li>
-                <li>Clique no botão <strong>“Criar minha senha”</strong>.</li>
-                <li>Informe novamente o seu e-mail cadastrado.</li>
-                <li>O sistema enviará um e-mail com o link para criação da sua senha.</li>
-                <li>Depois de criar a senha, volte a este e-mail e clique em <strong>“Acessar Portal LeaderTrack”</strong>.</li>
-              </ol>
-
-              <p>
-                <a href="{criar_senha_url}" target="_blank" style="padding:12px 24px; background:#111827; color:white; text-decoration:none; border-radius:8px; display:inline-block; margin-right:8px;">
-                  Criar minha senha
-                </a>
-
-                <a href="{login_portal_url}" target="_blank" style="padding:12px 24px; background:#007bff; color:white; text-decoration:none; border-radius:8px; display:inline-block;">
-                  Acessar Portal LeaderTrack
-                </a>
-              </p>
-
-              <p><strong>Links para copiar, se necessário:</strong></p>
-              <p><strong>Criar senha:</strong></p>
-              <p style="background:#f5f5f5; padding:10px; border-radius:5px; font-family:monospace;">{criar_senha_url}</p>
-              <p><strong>Acessar Portal:</strong></p>
-              <p style="background:#f5f5f5; padding:10px; border-radius:5px; font-family:monospace;">{login_portal_url}</p>
-
-              <p style="background:#fff7ed; border-left:4px solid #f97316; padding:12px; border-radius:6px;">
-                <strong>Importante:</strong> o e-mail de redefinição de senha pode cair na caixa de
-                <strong>Spam</strong>, <strong>Lixo eletrônico</strong>, <strong>Promoções</strong> ou similar.
-                Caso não encontre na caixa de entrada, verifique essas pastas.
-              </p>
-
-              <p>No portal, você verá os módulos disponíveis conforme seu perfil de acesso.</p>
-
-              <p>Em caso de dificuldade, entre em contato com o RH ou com o responsável pelo projeto LeaderTrack.</p>
-
-              <hr>
-              <p style="font-size:12px;color:#777;">The HR Key | LeaderTrack | Avaliação de Desempenho</p>
-            </div>
-            """
-
-            msg = MIMEMultipart()
-            msg["From"] = f"The HR Key <{remetente}>"
-            msg["To"] = email
-            msg["Subject"] = assunto
-            msg.attach(MIMEText(corpo, "html"))
-
-            with smtplib.SMTP(smtp_server, porta) as server:
-                server.ehlo()
-                server.starttls(context=ssl.create_default_context())
-                server.ehlo()
-                server.login(remetente, senha_remetente)
-                server.sendmail(remetente, email, msg.as_string())
-
-            usuario["enviado"] = True
-            usuario["enviado_em"] = datetime.now().isoformat()
-            usuario["erro"] = None
-            enviados += 1
-            logs.append(f"✅ E-mail do Portal enviado para {email}")
 
-        except Exception as e:
-            erros += 1
-            usuario["erro"] = str(e)
-            logs.append(f"❌ Erro ao enviar para {usuario.get('user_email', 'sem email')}: {str(e)}")
+@app.route("/arquivo-tokens/consultar")
+def consultar_arquivo_tokens():
+    # Registros arquivados, um JSON por linha, em streaming.
+    tabela = request.args.get("tabela", "tokens")
+    if tabela not in arquivo_tokens.COLECOES_ARQUIVAVEIS:
+        return f"❌ Coleção sem arquivo morto: {tabela}", 400
+
+    filtros = {
+        campo: request.args[campo].strip()
+        for campo in ("token", "email", "emailLider", "empresa")
+        if request.args.get(campo, "").strip()
+    }
+    codrodada = request.args.get("codrodada", "").strip() or None
+    linhas = (
+        json.dumps(r, ensure_ascii=False) + "\n"
+        for r in arquivo_tokens.consultar_arquivo(tabela, codrodada, **filtros)
+    )
+    return Response(stream_with_context(linhas), mimetype="application/x-ndjson")
 
-    salvar_portal_desempenho_usuarios(usuarios)
 
-    resumo = f"✅ E-mails Portal enviados: {enviados} | ⏭️ Pulados: {pulados} | ❌ Erros: {erros} | 📦 Total: {len(usuarios)}"
-    return f"<pre>{resumo}\n\n" + "\n".join(logs) + "</pre>"
+@app.route("/metrics")
+def metrics():
+    medidas = [
+        ("colecao_registros", {"tabela": tabela}, armazenamento.contar_registros(tabela))
+        for tabela in armazenamento.COLECOES
+    ]
+    medidas.append(("app_inicializacao_segundos", {}, INICIALIZACAO_SEGUNDOS))
+    return Response(metricas.texto(medidas), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/painel-admin")
+@pagina_estatica
 def painel_admin():
     return '''
     <!DOCTYPE html>
@@ -888,9 +1300,10 @@ def painel_admin():
             <h2>📋 Sistema de Formulários (Tokens Temporários)</h2>
 
             <form action="/upload" method="post" enctype="multipart/form-data" target="_blank">
-                <p><strong>1. Upload da planilha Excel (Formulários)</strong></p>
+                <p><strong>1. Upload da planilha Excel ou CSV (Formulários)</strong></p>
                 <p><em>Formato: nome, email, company, codrodada, produto, tipo, nomeLider, emailLider</em></p>
-                <input type="file" name="file" accept=".xlsx" required>
+                <input type="file" name="file" accept=".csv,.xlsx" required>
+                <label><input type="checkbox" name="modo" value="mesclar"> Mesclar com os tokens atuais</label>
                 <input type="submit" value="Gerar Tokens Formulários" class="btn">
             </form>
 
@@ -899,6 +1312,7 @@ def painel_admin():
 
             <p><strong>3. Enviar E-mails (Formulários)</strong></p>
             <a href="/enviar-emails" target="_blank" class="btn btn-success">✉️ Enviar Links Formulários</a>
+            <a href="/enviar-emails?reenviar=1" target="_blank" class="btn btn-warning">🔁 Reenviar para Todos</a>
 
             <p><strong>4. Excluir Tokens (Formulários)</strong></p>
             <a href="/excluir-tokens" target="_blank" class="btn btn-danger">🗑️ Excluir Tokens Formulários</a>
@@ -908,9 +1322,10 @@ def painel_admin():
             <h2>🎯 Sistema LeaderTrack (Tokens Permanentes)</h2>
 
             <form action="/upload-leadertrack" method="post" enctype="multipart/form-data" target="_blank">
-                <p><strong>1. Upload da planilha Excel (LeaderTrack)</strong></p>
+                <p><strong>1. Upload da planilha Excel ou CSV (LeaderTrack)</strong></p>
                 <p><em>Formato: nomeLider, emailLider, company, codrodada</em></p>
-                <input type="file" name="file" accept=".xlsx" required>
+                <input type="file" name="file" accept=".csv,.xlsx" required>
+                <label><input type="checkbox" name="chave" value="rodada"> Um token por empresa/rodada</label>
                 <input type="submit" value="Gerar Tokens LeaderTrack" class="btn btn-warning">
             </form>
 
@@ -919,9 +1334,11 @@ def painel_admin():
 
             <p><strong>3. Enviar E-mails (LeaderTrack)</strong></p>
             <a href="/enviar-emails-leadertrack" target="_blank" class="btn btn-success">✉️ Enviar Links LeaderTrack</a>
+            <a href="/enviar-emails-leadertrack?reenviar=1" target="_blank" class="btn btn-warning">🔁 Reenviar para Todos</a>
 
             <p><strong>4. Excluir Tokens (LeaderTrack)</strong></p>
             <a href="/excluir-tokens-leadertrack" target="_blank" class="btn btn-danger">🗑️ Excluir Tokens LeaderTrack</a>
+            <a href="/revogar-tokens-leadertrack" target="_blank" class="btn btn-danger">🚫 Revogar Tokens LeaderTrack</a>
         </div>
 
         <div class="card section-portal">
@@ -940,14 +1357,54 @@ def painel_admin():
 
             <p><strong>3. Enviar e-mails de acesso ao Portal</strong></p>
             <a href="/enviar-emails-portal-desempenho" target="_blank" class="btn btn-success">✉️ Enviar Acessos ao Portal</a>
+            <a href="/enviar-emails-portal-desempenho?reenviar=1" target="_blank" class="btn btn-warning">🔁 Reenviar para Todos</a>
 
             <p><strong>4. Excluir lista carregada do Portal</strong></p>
             <a href="/excluir-usuarios-portal-desempenho" target="_blank" class="btn btn-danger">🗑️ Excluir Lista do Portal</a>
         </div>
+
+        <div class="card section">
+            <h2>📬 Envios de E-mail</h2>
+            <p><em>Os envios rodam em segundo plano. Acompanhe aqui o progresso (enviados, pulados, erros e restantes).</em></p>
+            <p><em>Um envio interrompido continua de onde parou ao clicar novamente em Enviar; use Reenviar para mandar a todos outra vez.</em></p>
+            <a href="/jobs-envio" target="_blank" class="btn">📬 Acompanhar Envios</a>
+        </div>
+
+        <div class="card section">
+            <h2>🗄️ Arquivo Morto de Tokens</h2>
+            <p><em>Tokens de formulários usados ou expirados e tokens LeaderTrack inativos saem do banco ativo e ficam em arquivos comprimidos por rodada.</em></p>
+            <a href="/compactar-tokens" target="_blank" class="btn btn-warning">🗜️ Compactar Tokens</a>
+            <a href="/arquivo-tokens" target="_blank" class="btn">🗄️ Consultar Arquivo Morto</a>
+        </div>
     </body>
     </html>
     '''
 
 
+# Dependências pesadas que só as rotas de upload usam (ver ingestao.py); não devem aparecer
+# carregadas na inicialização.
+MODULOS_PESADOS = ("pandas", "numpy", "openpyxl")
+
+
+def relatorio_inicializacao():
+    # Uma linha por processo que carrega o app (cada worker, ou o master com --preload).
+    segundos = time.perf_counter() - INICIO_CARREGAMENTO
+    carregados = [m for m in MODULOS_PESADOS if m in sys.modules]
+    memoria = ""
+    if resource is not None:
+        # ru_maxrss vem em KB no Linux e em bytes no macOS.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+        memoria = f", memória {rss_mb:.1f} MB"
+    print(
+        f"🚀 App carregado em {segundos * 1000:.0f} ms (pid {os.getpid()}{memoria}, "
+        f"módulos pesados carregados: {', '.join(carregados) or 'nenhum'})"
+    )
+    return segundos
+
+
+INICIALIZACAO_SEGUNDOS = relatorio_inicializacao()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=3000)
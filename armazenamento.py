@@ -0,0 +1,547 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from functools import wraps
+from contextlib import contextmanager
+
+import metricas
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.environ.get("TOKENS_DB_FILE", os.path.join(BASE_DIR, "tokens.db"))
+
+# Em modo WAL cada escrita é apenas anexada ao journal (tokens.db-wal). A cada
+# JOURNAL_COMPACTAR_A_CADA escritas o journal é dobrado de volta no banco principal.
+JOURNAL_COMPACTAR_A_CADA = int(os.environ.get("JOURNAL_COMPACTAR_A_CADA", "500"))
+
+# Com vários workers do gunicorn, quem encontra o banco travado para escrita espera até
+# DB_TIMEOUT segundos pela vez (busy_timeout) em vez de falhar com "database is locked".
+DB_TIMEOUT = float(os.environ.get("TOKENS_DB_TIMEOUT", "30"))
+
+# Cada coleção guarda o registro completo em "dados" (JSON) e replica em colunas
+# apenas os campos usados em buscas, para que fiquem indexados.
+COLECOES = {
+    "tokens": {
+        "chave": "token",
+        "colunas": [
+            "token", "email", "emailLider", "empresa", "codrodada", "produto", "tipo",
+            "usado", "enviado", "expira_em",
+        ],
+        "indices": ["token", "emailLider", "codrodada", "empresa", ("email", "codrodada", "produto", "tipo")],
+        "arquivo_json": os.path.join(BASE_DIR, "tokens.json"),
+    },
+    "leader_track_tokens": {
+        "chave": "token",
+        "colunas": ["token", "emailLider", "empresa", "codrodada", "ativo", "enviado"],
+        "indices": ["token", "emailLider", "codrodada", "empresa", ("empresa", "codrodada", "emailLider")],
+        "arquivo_json": os.path.join(BASE_DIR, "leader_track_tokens.json"),
+    },
+    "portal_desempenho_usuarios": {
+        "chave": "user_email",
+        "colunas": ["user_email", "enviado"],
+        "indices": ["user_email"],
+        "arquivo_json": os.path.join(BASE_DIR, "portal_desempenho_usuarios.json"),
+    },
+}
+
+_local = threading.local()
+
+# Buscas por chave (token, user_email) vão direto ao índice da coluna no SQLite: custam o
+# mesmo em qualquer worker, sem cópia da coleção em memória nem reconstrução após escritas
+# de outro processo.
+BUSCA_LOTE = 500
+
+_escritas_lock = threading.Lock()
+_escritas_desde_compactacao = 0
+
+
+def conectar():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=DB_TIMEOUT, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(DB_TIMEOUT * 1000)}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        _inicializar(conn)
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def transacao(conn=None):
+    conn = conn or conectar()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _inicializar(conn):
+    with transacao(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT)")
+
+        for tabela, config in COLECOES.items():
+            colunas = ", ".join(f'"{c}" TEXT' for c in config["colunas"])
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {tabela} "
+                f"(id INTEGER PRIMARY KEY AUTOINCREMENT, {colunas}, dados TEXT NOT NULL)"
+            )
+            _migrar_colunas(conn, tabela, config["colunas"])
+            for colunas_indice in config["indices"]:
+                if isinstance(colunas_indice, str):
+                    colunas_indice = (colunas_indice,)
+                nome = "_".join(colunas_indice)
+                lista = ", ".join(f'"{c}"' for c in colunas_indice)
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_{nome} ON {tabela} ({lista})")
+
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs_envio ("
+            "id TEXT PRIMARY KEY, tipo TEXT, status TEXT, total INTEGER, enviados INTEGER, "
+            "pulados INTEGER, erros INTEGER, resumo TEXT, criado_em TEXT, atualizado_em TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs_envio_logs ("
+            "job_id TEXT, seq INTEGER, linha TEXT, PRIMARY KEY (job_id, seq))"
+        )
+
+        ja_importado = conn.execute("SELECT valor FROM meta WHERE chave = 'json_importado'").fetchone()
+        if not ja_importado:
+            for tabela, config in COLECOES.items():
+                if os.path.exists(config["arquivo_json"]):
+                    try:
+                        total = _importar_json(conn, tabela, config["arquivo_json"])
+                    except ValueError as e:
+                        print(f"❌ ERRO: {e}")
+                        continue
+                    print(f"📥 Importados {total} registros de {config['arquivo_json']} para {tabela}")
+            conn.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('json_importado', '1')")
+
+
+def _migrar_colunas(conn, tabela, colunas):
+    # Colunas novas em bancos antigos: cria e preenche a partir do JSON do registro.
+    atuais = {row["name"] for row in conn.execute(f"PRAGMA table_info({tabela})")}
+    for coluna in colunas:
+        if coluna not in atuais:
+            print(f"🛠️ Adicionando coluna {coluna} em {tabela}")
+            conn.execute(f'ALTER TABLE {tabela} ADD COLUMN "{coluna}" TEXT')
+            conn.execute(f"UPDATE {tabela} SET \"{coluna}\" = json_extract(dados, '$.{coluna}')")
+
+
+def _linha(tabela, registro):
+    config = COLECOES[tabela]
+    valores = [registro.get(c) for c in config["colunas"]]
+    valores.append(json.dumps(registro, ensure_ascii=False))
+    return valores
+
+
+def _inserir(conn, tabela, registros, destino=None):
+    # `destino`: outra tabela com as mesmas colunas da coleção (ex.: a de carga temporária).
+    config = COLECOES[tabela]
+    colunas = ", ".join(f'"{c}"' for c in config["colunas"])
+    marcadores = ", ".join("?" for _ in range(len(config["colunas"]) + 1))
+    cursor = conn.executemany(
+        f"INSERT INTO {destino or tabela} ({colunas}, dados) VALUES ({marcadores})",
+        (_linha(tabela, r) for r in registros),
+    )
+    return cursor.rowcount
+
+
+def _importar_json(conn, tabela, caminho):
+    with open(caminho, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    # Levanta erro em vez de devolver 0: em importar_json(substituir=True) isso desfaz o
+    # DELETE da mesma transação, e um arquivo ruim não apaga a coleção.
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        raise ValueError(f"{caminho} não está no formato esperado (lista de objetos JSON).")
+
+    return _inserir(conn, tabela, data)
+
+
+def compactar_journal():
+    ocupado, paginas, copiadas = conectar().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    if ocupado:
+        print(f"⏳ Compactação do journal adiada: {copiadas}/{paginas} páginas copiadas")
+    return not ocupado
+
+
+def _registrar_escrita():
+    global _escritas_desde_compactacao
+    with _escritas_lock:
+        _escritas_desde_compactacao += 1
+        if _escritas_desde_compactacao < JOURNAL_COMPACTAR_A_CADA:
+            return
+        _escritas_desde_compactacao = 0
+    compactar_journal()
+
+
+def _versao(conn, tabela):
+    row = conn.execute("SELECT valor FROM meta WHERE chave = ?", (f"versao:{tabela}",)).fetchone()
+    return int(row["valor"]) if row else 0
+
+
+def _incrementar_versao(conn, tabela):
+    conn.execute(
+        "INSERT INTO meta (chave, valor) VALUES (?, '1') "
+        "ON CONFLICT(chave) DO UPDATE SET valor = CAST(valor AS INTEGER) + 1",
+        (f"versao:{tabela}",),
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)",
+        (f"alterado_em:{tabela}", datetime.now(timezone.utc).isoformat()),
+    )
+    return _versao(conn, tabela)
+
+
+def versao_colecao(tabela):
+    # (versão, momento UTC da última escrita) da coleção; muda a cada gravação, em qualquer worker.
+    # Coleções nunca gravadas desde a criação do banco devolvem (0, None).
+    conn = conectar()
+    row = conn.execute("SELECT valor FROM meta WHERE chave = ?", (f"alterado_em:{tabela}",)).fetchone()
+    return _versao(conn, tabela), datetime.fromisoformat(row["valor"]) if row else None
+
+
+def _medido(operacao, quantidade=None):
+    # Duração de cada operação por coleção e, com `quantidade(resultado)`, os registros envolvidos.
+    def decorador(funcao):
+        @wraps(funcao)
+        def medida(tabela, *args, **kwargs):
+            inicio = time.perf_counter()
+            resultado = funcao(tabela, *args, **kwargs)
+            metricas.observar(
+                "armazenamento_duracao_segundos", time.perf_counter() - inicio, operacao=operacao, tabela=tabela
+            )
+            if quantidade:
+                metricas.incrementar(
+                    "armazenamento_registros_total", quantidade(resultado), operacao=operacao, tabela=tabela
+                )
+            return resultado
+        return medida
+    return decorador
+
+
+def importar_json(tabela, caminho=None, substituir=False):
+    caminho = caminho or COLECOES[tabela]["arquivo_json"]
+    with transacao() as conn:
+        if substituir:
+            conn.execute(f"DELETE FROM {tabela}")
+        total = _importar_json(conn, tabela, caminho)
+        _incrementar_versao(conn, tabela)
+    return total
+
+
+@_medido("carregar", len)
+def carregar_registros(tabela):
+    rows = conectar().execute(f"SELECT dados FROM {tabela} ORDER BY id")
+    return [json.loads(row["dados"]) for row in rows]
+
+
+@_medido("salvar", int)
+def salvar_registros(tabela, registros):
+    with transacao() as conn:
+        conn.execute(f"DELETE FROM {tabela}")
+        total = _inserir(conn, tabela, registros)
+        _incrementar_versao(conn, tabela)
+    return total
+
+
+@_medido("inserir", int)
+def inserir_registros(tabela, registros):
+    with transacao() as conn:
+        total = _inserir(conn, tabela, registros)
+        _incrementar_versao(conn, tabela)
+    return total
+
+
+@_medido("gravar_em_blocos", int)
+def gravar_em_blocos(tabela, blocos, substituir=False, chave_unica=None, descartados=None):
+    # Grava os blocos numa única transação: ou a planilha inteira entra, ou nada muda.
+    #
+    # Ler e preparar a planilha é o que demora, então isso acontece antes de travar o banco:
+    # os blocos vão para uma tabela temporária da conexão (fica no banco temporário do
+    # SQLite, não trava o tokens.db). O BEGIN IMMEDIATE cobre só a cópia para a coleção.
+    #
+    # Com `chave_unica` (colunas), linhas cuja chave já existe na coleção no momento da cópia
+    # não entram (ex.: outro upload gravou as mesmas chaves enquanto esta planilha era lida);
+    # se `descartados` for uma lista, recebe esses registros.
+    conn = conectar()
+    carga = f"temp.carga_{tabela}"
+    colunas = ", ".join(f'"{c}"' for c in COLECOES[tabela]["colunas"])
+
+    conn.execute(f"DROP TABLE IF EXISTS {carga}")
+    conn.execute(f"CREATE TABLE {carga} AS SELECT {colunas}, dados FROM {tabela} WHERE 0")
+    try:
+        for registros in blocos:
+            _inserir(conn, tabela, registros, destino=carga)
+
+        filtro = ""
+        with transacao(conn):
+            if substituir:
+                conn.execute(f"DELETE FROM {tabela}")
+
+            if chave_unica:
+                condicao = " AND ".join(f'c."{coluna}" IS carga."{coluna}"' for coluna in chave_unica)
+                filtro = f"WHERE NOT EXISTS (SELECT 1 FROM {tabela} c WHERE {condicao})"
+                if descartados is not None:
+                    descartados.extend(
+                        json.loads(row["dados"]) for row in conn.execute(
+                            f"SELECT dados FROM {carga} carga WHERE EXISTS "
+                            f"(SELECT 1 FROM {tabela} c WHERE {condicao}) ORDER BY rowid"
+                        )
+                    )
+
+            total = conn.execute(
+                f"INSERT INTO {tabela} ({colunas}, dados) "
+                f"SELECT {colunas}, dados FROM {carga} carga {filtro} ORDER BY rowid"
+            ).rowcount
+            _incrementar_versao(conn, tabela)
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS {carga}")
+
+    _registrar_escrita()
+    return total
+
+
+def valores_colunas(tabela, colunas):
+    # Lido direto do índice das colunas, sem decodificar o JSON dos registros.
+    lista = ", ".join(f'"{c}"' for c in colunas)
+    rows = conectar().execute(f"SELECT DISTINCT {lista} FROM {tabela}")
+    return {tuple(row) for row in rows}
+
+
+def _condicoes(filtros):
+    # Filtros por igualdade nas colunas indexadas. Booleanos ficam como '1'/'0' na coluna
+    # (afinidade TEXT); "expirado" compara expira_em (ISO 8601) com o momento atual.
+    condicoes = []
+    parametros = []
+    for coluna, valor in filtros.items():
+        if coluna == "expirado":
+            condicoes.append("expira_em < ?" if valor else "(expira_em IS NULL OR expira_em >= ?)")
+            parametros.append(datetime.now().isoformat())
+        elif isinstance(valor, bool):
+            condicoes.append(f"COALESCE(\"{coluna}\", '0') = ?")
+            parametros.append("1" if valor else "0")
+        else:
+            condicoes.append(f'"{coluna}" = ?')
+            parametros.append(valor)
+    return condicoes, parametros
+
+
+@_medido("listar_pagina", lambda resultado: len(resultado[0]))
+def listar_pagina(tabela, filtros=None, limite=100, cursor=0, offset=0):
+    # Paginação por cursor (id do último registro da página anterior) ou por offset.
+    total = contar_registros(tabela, filtros)
+    rows = _consultar_pagina(tabela, filtros, limite, cursor, offset)
+
+    registros = [json.loads(row["dados"]) for row in rows]
+    proximo_cursor = rows[-1]["id"] if len(rows) == limite else None
+    return registros, total, proximo_cursor
+
+
+def iterar_registros(tabela, filtros=None, lote=500):
+    # Percorre todos os registros filtrados em lotes pelo id, com memória constante.
+    cursor = 0
+    while True:
+        rows = _consultar_pagina(tabela, filtros, lote, cursor)
+        for row in rows:
+            yield json.loads(row["dados"])
+        if len(rows) < lote:
+            return
+        cursor = rows[-1]["id"]
+
+
+def _consultar_pagina(tabela, filtros, limite, cursor=0, offset=0):
+    condicoes, parametros = _condicoes(filtros or {})
+    condicoes.append("id > ?")
+    return conectar().execute(
+        f"SELECT id, dados FROM {tabela} WHERE {' AND '.join(condicoes)} ORDER BY id LIMIT ? OFFSET ?",
+        parametros + [cursor, limite, offset],
+    ).fetchall()
+
+
+def contar_registros(tabela, filtros=None):
+    condicoes, parametros = _condicoes(filtros or {})
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    return conectar().execute(f"SELECT COUNT(*) FROM {tabela} {where}", parametros).fetchone()[0]
+
+
+@_medido("buscar")
+def buscar_registro(tabela, valor, campo=None):
+    campo = campo or COLECOES[tabela]["chave"]
+    row = conectar().execute(
+        f'SELECT dados FROM {tabela} WHERE "{campo}" = ? ORDER BY id LIMIT 1', (valor,)
+    ).fetchone()
+    return json.loads(row["dados"]) if row else None
+
+
+@_medido("buscar_varios", len)
+def buscar_registros(tabela, valores):
+    # Várias chaves com uma consulta por lote de BUSCA_LOTE; devolve {valor: registro} só dos
+    # encontrados (com chave repetida, vale o registro mais antigo, como em buscar_registro).
+    chave = COLECOES[tabela]["chave"]
+    valores = list(dict.fromkeys(valores))
+    conn = conectar()
+    dados = {}
+    for i in range(0, len(valores), BUSCA_LOTE):
+        lote = valores[i:i + BUSCA_LOTE]
+        marcadores = ", ".join("?" for _ in lote)
+        for row in conn.execute(
+            f'SELECT "{chave}", dados FROM {tabela} WHERE "{chave}" IN ({marcadores}) ORDER BY id', lote
+        ):
+            dados.setdefault(row[0], row[1])
+    return {valor: json.loads(texto) for valor, texto in dados.items()}
+
+
+@_medido("atualizar", lambda resultado: sum(1 for r in resultado if r))
+def atualizar_registros(tabela, alteracoes):
+    # alteracoes: lista de (valor da chave, campos a mesclar). Tudo numa única transação.
+    chave = COLECOES[tabela]["chave"]
+    atribuicoes = ", ".join(f'"{c}" = ?' for c in COLECOES[tabela]["colunas"])
+    atualizados = []
+
+    with transacao() as conn:
+        for valor, campos in alteracoes:
+            row = conn.execute(
+                f'SELECT id, dados FROM {tabela} WHERE "{chave}" = ? ORDER BY id LIMIT 1', (valor,)
+            ).fetchone()
+            if not row:
+                atualizados.append(None)
+                continue
+
+            registro = json.loads(row["dados"])
+            registro.update(campos)
+            conn.execute(
+                f"UPDATE {tabela} SET {atribuicoes}, dados = ? WHERE id = ?",
+                _linha(tabela, registro) + [row["id"]],
+            )
+            atualizados.append(registro)
+
+        if not any(atualizados):
+            return atualizados
+        _incrementar_versao(conn, tabela)
+
+    _registrar_escrita()
+    return atualizados
+
+
+def atualizar_registro(tabela, valor, campos):
+    return atualizar_registros(tabela, [(valor, campos)])[0]
+
+
+@_medido("atualizar_se", lambda resultado: 1 if resultado else 0)
+def atualizar_se(tabela, valor, campos, condicao, parametros=()):
+    # Compare-and-set: mescla `campos` só se o registro ainda atende à condição SQL. A
+    # checagem e a escrita acontecem na mesma transação (BEGIN IMMEDIATE), então entre
+    # workers concorrentes apenas um aplica a mudança. Devolve o registro ou None.
+    chave = COLECOES[tabela]["chave"]
+    atribuicoes = ", ".join(f'"{c}" = ?' for c in COLECOES[tabela]["colunas"])
+
+    with transacao() as conn:
+        row = conn.execute(
+            f'SELECT id, dados FROM {tabela} WHERE "{chave}" = ? AND ({condicao}) ORDER BY id LIMIT 1',
+            [valor, *parametros],
+        ).fetchone()
+        if not row:
+            return None
+
+        registro = json.loads(row["dados"])
+        registro.update(campos)
+        conn.execute(
+            f"UPDATE {tabela} SET {atribuicoes}, dados = ? WHERE id = ?",
+            _linha(tabela, registro) + [row["id"]],
+        )
+        _incrementar_versao(conn, tabela)
+
+    _registrar_escrita()
+    return registro
+
+
+@_medido("extrair", int)
+def extrair_registros(tabela, condicao, parametros, destino, lote=1000):
+    # Entrega a destino(registros) os registros que atendem à condição SQL e os apaga da
+    # coleção, em lotes. Cada lote é entregue e apagado dentro da mesma transação: se o
+    # destino falhar, nada é removido.
+    total = 0
+    while True:
+        with transacao() as conn:
+            rows = conn.execute(
+                f"SELECT id, dados FROM {tabela} WHERE {condicao} ORDER BY id LIMIT ?", [*parametros, lote]
+            ).fetchall()
+            if rows:
+                destino([json.loads(row["dados"]) for row in rows])
+                conn.executemany(f"DELETE FROM {tabela} WHERE id = ?", [(row["id"],) for row in rows])
+                _incrementar_versao(conn, tabela)
+
+        if not rows:
+            break
+        total += len(rows)
+        _registrar_escrita()
+        if len(rows) < lote:
+            break
+    return total
+
+
+def criar_job(job, exclusivo_desde=None):
+    # Com exclusivo_desde, só cria o job se não houver outro do mesmo tipo ainda ativo
+    # (atualizado depois desse instante); a checagem e o INSERT são atômicos entre workers.
+    # Devolve o id do job que ficou valendo.
+    with transacao() as conn:
+        if exclusivo_desde is not None:
+            row = conn.execute(
+                "SELECT id FROM jobs_envio WHERE tipo = ? AND status IN ('na fila', 'executando') "
+                "AND atualizado_em > ? ORDER BY criado_em DESC LIMIT 1",
+                (job["tipo"], exclusivo_desde),
+            ).fetchone()
+            if row:
+                return row["id"]
+
+        conn.execute(
+            "INSERT INTO jobs_envio (id, tipo, status, total, enviados, pulados, erros, resumo, criado_em, atualizado_em) "
+            "VALUES (:id, :tipo, :status, :total, :enviados, :pulados, :erros, :resumo, :criado_em, :atualizado_em)",
+            job,
+        )
+    return job["id"]
+
+
+def atualizar_job(job, novas_linhas, primeira_seq):
+    with transacao() as conn:
+        conn.execute(
+            "UPDATE jobs_envio SET status = :status, total = :total, enviados = :enviados, pulados = :pulados, "
+            "erros = :erros, resumo = :resumo, atualizado_em = :atualizado_em WHERE id = :id",
+            job,
+        )
+        conn.executemany(
+            "INSERT INTO jobs_envio_logs (job_id, seq, linha) VALUES (?, ?, ?)",
+            ((job["id"], seq, linha) for seq, linha in enumerate(novas_linhas, start=primeira_seq)),
+        )
+
+
+def obter_job(job_id):
+    row = conectar().execute("SELECT * FROM jobs_envio WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def listar_jobs(limite=50):
+    rows = conectar().execute("SELECT * FROM jobs_envio ORDER BY criado_em DESC LIMIT ?", (limite,))
+    return [dict(row) for row in rows]
+
+
+def logs_job(job_id, apos_seq=-1, limite=500):
+    rows = conectar().execute(
+        "SELECT seq, linha FROM jobs_envio_logs WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+        (job_id, apos_seq, limite),
+    )
+    return [(row["seq"], row["linha"]) for row in rows]
+
+
+def ultimos_logs_job(job_id, limite=200):
+    rows = conectar().execute(
+        "SELECT seq, linha FROM jobs_envio_logs WHERE job_id = ? ORDER BY seq DESC LIMIT ?", (job_id, limite)
+    )
+    return [(row["seq"], row["linha"]) for row in reversed(rows.fetchall())]
@@ -0,0 +1,105 @@
+import os
+import re
+import gzip
+import json
+from glob import glob
+from datetime import datetime
+
+import armazenamento
+
+# Arquivo morto dos tokens: os registros que não são mais usados saem do banco e vão
+# para arquivos JSON Lines comprimidos, um por coleção e rodada
+# (<ARQUIVO_DIR>/<tabela>/<codrodada>.jsonl.gz), que continuam consultáveis para auditoria.
+
+ARQUIVO_DIR = os.environ.get(
+    "TOKENS_ARQUIVO_DIR", os.path.join(os.path.dirname(os.path.abspath(armazenamento.DB_FILE)), "arquivo")
+)
+
+COLECOES_ARQUIVAVEIS = ("tokens", "leader_track_tokens")
+
+
+def _criterio(tabela):
+    # Tokens de formulário usados ou expirados; tokens LeaderTrack desativados.
+    if tabela == "tokens":
+        return (
+            "COALESCE(usado, '0') = '1' OR (expira_em <> '' AND expira_em < ?)",
+            [datetime.now().isoformat()],
+        )
+    return "ativo = '0'", []
+
+
+def _nome_rodada(codrodada):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(codrodada or "")) or "sem_rodada"
+
+
+def _caminho(tabela, codrodada):
+    return os.path.join(ARQUIVO_DIR, tabela, f"{_nome_rodada(codrodada)}.jsonl.gz")
+
+
+def _gravar(tabela, registros):
+    agora = datetime.now().isoformat()
+    por_rodada = {}
+    for registro in registros:
+        registro["arquivado_em"] = agora
+        por_rodada.setdefault(_caminho(tabela, registro.get("codrodada")), []).append(registro)
+
+    os.makedirs(os.path.join(ARQUIVO_DIR, tabela), exist_ok=True)
+    for caminho, lote in por_rodada.items():
+        # Cada gravação acrescenta um novo membro gzip ao arquivo da rodada; o fsync garante
+        # que o lote está em disco antes de ser apagado do banco.
+        with open(caminho, "ab") as bruto:
+            with gzip.GzipFile(fileobj=bruto, mode="wb") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in lote).encode("utf-8"))
+            bruto.flush()
+            os.fsync(bruto.fileno())
+
+
+def compactar(tabelas=COLECOES_ARQUIVAVEIS):
+    resultado = {}
+    for tabela in tabelas:
+        condicao, parametros = _criterio(tabela)
+        total = armazenamento.extrair_registros(
+            tabela, condicao, parametros, lambda registros, tabela=tabela: _gravar(tabela, registros)
+        )
+        resultado[tabela] = total
+        print(f"🗄️ {total} registros de {tabela} movidos para o arquivo morto")
+
+    armazenamento.compactar_journal()
+    return resultado
+
+
+def listar_arquivos():
+    arquivos = []
+    for tabela in COLECOES_ARQUIVAVEIS:
+        for caminho in sorted(glob(os.path.join(ARQUIVO_DIR, tabela, "*.jsonl.gz"))):
+            arquivos.append({
+                "tabela": tabela,
+                "rodada": os.path.basename(caminho)[:-len(".jsonl.gz")],
+                "bytes": os.path.getsize(caminho),
+            })
+    return arquivos
+
+
+def consultar_arquivo(tabela, codrodada=None, **filtros):
+    # Percorre o arquivo da rodada (ou todos os da coleção) devolvendo os registros cujos
+    # campos são iguais aos filtros informados. A rodada aceita também o nome do arquivo.
+    if codrodada is not None:
+        caminhos = [_caminho(tabela, codrodada)]
+    else:
+        caminhos = sorted(glob(os.path.join(ARQUIVO_DIR, tabela, "*.jsonl.gz")))
+
+    for caminho in caminhos:
+        if not os.path.exists(caminho):
+            continue
+        try:
+            with gzip.open(caminho, "rt", encoding="utf-8") as f:
+                for linha in f:
+                    registro = json.loads(linha)
+                    if codrodada is not None and codrodada not in (
+                        str(registro.get("codrodada", "")), _nome_rodada(registro.get("codrodada"))
+                    ):
+                        continue
+                    if all(str(registro.get(campo, "")) == str(valor) for campo, valor in filtros.items()):
+                        yield registro
+        except (EOFError, gzip.BadGzipFile):
+            print(f"⚠️ Arquivo morto truncado (última gravação incompleta): {caminho}")
@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import argparse
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modelos_email import ModeloEmail, renderizar_template
+
+# Custo por mensagem para montar o corpo (e a mensagem MIME completa) dos e-mails de
+# formulário: f-string montada a cada destinatário (como era antes), template Jinja
+# renderizado inteiro a cada destinatário e ModeloEmail com as partes fixas prontas.
+#
+#   python benchmarks/render_emails.py --mensagens 20000
+
+RODAPE = "The HR Key | Programa de Liderança de Alta Performance"
+ASSUNTO = "🚀 Link de Acesso ao Formulário - The HR Key"
+REMETENTE = "remetente@example.com"
+
+
+def destinatarios(quantidade):
+    for i in range(quantidade):
+        yield {
+            "email": f"pessoa{i}@example.com",
+            "nome": f"Pessoa {i}",
+            "produto": "ARQUETIPOS",
+            "tipo": "AUTOAVALIACAO",
+            "url_final": f"https://gestor.thehrkey.tech/form_arquetipos_autoaval?email=pessoa{i}%40example.com&codrodada=r1",
+        }
+
+
+def corpo_legado(d):
+    return f"""
+    <p>Olá, <strong>{d['nome']}</strong>!</p>
+    <p>Segue o link de acesso ao formulário <strong>{d['produto']} - {d['tipo']}</strong>:</p>
+    <p><a href="{d['url_final']}" target="_blank">{d['url_final']}</a></p>
+    <p>⚠️ Este link é único, válido por 2 dias, e pode ser acessado apenas 1 vez.</p>
+    <hr>
+    <p style="font-size:12px;color:#777;">{RODAPE}</p>
+    """
+
+
+def corpo_jinja(d):
+    return renderizar_template(
+        "formulario", nome=d["nome"], produto=d["produto"], tipo=d["tipo"], url_final=d["url_final"],
+        dias_validade=2, rodape=RODAPE
+    )
+
+
+def mensagem_legada(d):
+    msg = MIMEMultipart()
+    msg["From"] = f"The HR Key <{REMETENTE}>"
+    msg["To"] = d["email"]
+    msg["Subject"] = ASSUNTO
+    msg.attach(MIMEText(corpo_legado(d), "html"))
+    return msg
+
+
+def medir(funcao, quantidade):
+    inicio = time.perf_counter()
+    for d in destinatarios(quantidade):
+        funcao(d)
+    return (time.perf_counter() - inicio) / quantidade * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo de renderização por mensagem")
+    parser.add_argument("--mensagens", type=int, default=20000)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    modelo = ModeloEmail(
+        "formulario", ASSUNTO, ["nome", "produto", "tipo", "url_final"], dias_validade=2, rodape=RODAPE
+    )
+    preparo_modelo = (time.perf_counter() - inicio) * 1e6
+
+    def corpo_modelo(d):
+        return modelo.renderizar(nome=d["nome"], produto=d["produto"], tipo=d["tipo"], url_final=d["url_final"])
+
+    def mensagem_modelo(d):
+        campos = {k: d[k] for k in ("nome", "produto", "tipo", "url_final")}
+        return modelo.mensagem(REMETENTE, d["email"], **campos)
+
+    n = args.mensagens
+    resultados = [
+        ("corpo: f-string por mensagem (antes)", medir(corpo_legado, n)),
+        ("corpo: Jinja completo por mensagem", medir(corpo_jinja, n)),
+        ("corpo: ModeloEmail (partes fixas por lote)", medir(corpo_modelo, n)),
+        ("mensagem MIME + as_string (antes)", medir(lambda d: mensagem_legada(d).as_string(), n)),
+        ("mensagem MIME + as_string (ModeloEmail)", medir(lambda d: mensagem_modelo(d).as_string(), n)),
+    ]
+
+    print(f"📨 {n} mensagens | preparo do ModeloEmail (uma vez por lote): {preparo_modelo:.0f} µs")
+    for nome, micros in resultados:
+        print(f"  {nome:<45} {micros:8.2f} µs/mensagem")
+
+
+if __name__ == "__main__":
+    main()
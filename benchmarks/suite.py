@@ -0,0 +1,277 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import smtplib
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+from functools import partial
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# Banco temporário antes de importar o app: o benchmark nunca toca o tokens.db real.
+PASTA = tempfile.mkdtemp(prefix="bench-tokens-")
+os.environ["TOKENS_DB_FILE"] = os.path.join(PASTA, "inicial.db")
+
+import armazenamento
+
+for _config in armazenamento.COLECOES.values():
+    _config["arquivo_json"] = os.path.join(PASTA, "inexistente.json")
+
+import app
+import jobs_envio
+
+# Microbenchmarks dos caminhos quentes, com bancos e planilhas sintéticos:
+# carregar/salvar tokens, busca do token em completar_cadastro, ingestão do upload,
+# listagens, montagem dos e-mails e envio (com um SMTP local de mentira).
+#
+#   python benchmarks/suite.py --saida resultado.json
+#   python benchmarks/suite.py --tamanhos 1000,10000,100000,1000000 --saida completo.json
+#
+# O padrão vai até 100k registros. A rodada completa com 1M leva vários minutos, quase
+# todos no upload de 1M linhas (sobretudo em xlsx); --max-xlsx e --max-upload limitam isso.
+#
+# O JSON de saída tem o ambiente (commit, python, máquina) e uma linha por medição,
+# para comparar execuções.
+
+PRODUTOS = [("arquetipos", "Autoavaliação"), ("arquetipos", "Avaliação Equipe"), ("microambiente", "microambiente_equipe")]
+
+
+class SMTPLocal:
+    # Substitui smtplib.SMTP: aceita tudo sem rede, só conta as mensagens.
+    mensagens = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def ehlo(self):
+        pass
+
+    def starttls(self, **kwargs):
+        pass
+
+    def login(self, *args):
+        pass
+
+    def sendmail(self, remetente, destinatario, mensagem):
+        SMTPLocal.mensagens += 1
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def tokens_sinteticos(quantidade):
+    expira_em = (datetime.now() + timedelta(days=2)).isoformat()
+    for i in range(quantidade):
+        produto, tipo = PRODUTOS[i % len(PRODUTOS)]
+        yield {
+            "nome": f"Pessoa {i}",
+            "email": f"pessoa{i}@example.com",
+            "empresa": f"Empresa {i % 50}",
+            "codrodada": f"R{i % 20}",
+            "produto": produto,
+            "tipo": tipo,
+            "nomeLider": f"Líder {i % 500}",
+            "emailLider": f"lider{i % 500}@example.com",
+            "token": f"{i:032x}",
+            "expira_em": expira_em,
+            "usado": False,
+        }
+
+
+COLUNAS_PLANILHA = ["nome", "email", "company", "codrodada", "produto", "tipo", "nomeLider", "emailLider"]
+
+
+def linhas_planilha(quantidade):
+    for t in tokens_sinteticos(quantidade):
+        yield [t["nome"], t["email"], t["empresa"], t["codrodada"], t["produto"], t["tipo"], t["nomeLider"], t["emailLider"]]
+
+
+def planilha_csv(quantidade):
+    linhas = [";".join(COLUNAS_PLANILHA)] + [";".join(linha) for linha in linhas_planilha(quantidade)]
+    return ("\n".join(linhas) + "\n").encode("utf-8")
+
+
+def planilha_xlsx(quantidade):
+    # Gerada em modo write_only, como chega do Excel: é o caminho de leitura em streaming do upload.
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(COLUNAS_PLANILHA)
+    for linha in linhas_planilha(quantidade):
+        ws.append(linha)
+    saida = io.BytesIO()
+    wb.save(saida)
+    return saida.getvalue()
+
+
+def novo_banco(nome):
+    armazenamento.DB_FILE = os.path.join(PASTA, f"{nome}.db")
+    armazenamento._local.conn = None
+
+
+def cronometrar(funcao, repeticoes=1):
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor
+
+
+def medir_tamanho(n, args, resultados):
+    cliente = app.app.test_client()
+    amostra = [f"{i:032x}" for i in random.Random(n).sample(range(n), min(n, 1000))]
+
+    def registrar(operacao, segundos, itens):
+        linha = {
+            "tamanho": n,
+            "operacao": operacao,
+            "segundos": round(segundos, 6),
+            "itens": itens,
+            "us_por_item": round(segundos / itens * 1e6, 3) if itens else None,
+        }
+        resultados.append(linha)
+        print(f"  {operacao:<40} {segundos:10.4f} s  ({linha['us_por_item']} µs/item, {itens} itens)")
+
+    print(f"📦 {n} registros")
+    novo_banco(f"store-{n}")
+
+    registrar("salvar_tokens", cronometrar(lambda: app.salvar_tokens(tokens_sinteticos(n))), n)
+    registrar("carregar_tokens", cronometrar(app.carregar_tokens, args.repeticoes), n)
+
+    registrar(
+        "buscar_token",
+        cronometrar(lambda: [app.buscar_token(t) for t in amostra], args.repeticoes), len(amostra)
+    )
+    registrar(
+        "buscar_registros (lote)",
+        cronometrar(lambda: armazenamento.buscar_registros("tokens", amostra), args.repeticoes), len(amostra)
+    )
+    registrar(
+        "GET /completar-cadastro",
+        cronometrar(lambda: [cliente.get(f"/completar-cadastro?token={t}") for t in amostra[:200]]), len(amostra[:200])
+    )
+
+    registrar(
+        "GET /listar-tokens (página)",
+        cronometrar(lambda: cliente.get("/listar-tokens").get_data(), args.repeticoes), min(n, 100)
+    )
+    registrar("GET /listar-tokens?todos=1", cronometrar(lambda: cliente.get("/listar-tokens?todos=1").get_data()), n)
+    registrar("GET /api/tokens?formato=ndjson", cronometrar(lambda: cliente.get("/api/tokens?formato=ndjson").get_data()), n)
+
+    registros = list(tokens_sinteticos(min(n, args.max_emails)))
+    modelo = app.modelo_email_formulario()
+
+    def montar_emails():
+        for i, registro in enumerate(registros, start=1):
+            envio = app.preparar_email_formulario(i, registro, "remetente@example.com", [], modelo)
+            envio[1].as_string()
+
+    registrar("montar e-mail (corpo + MIME)", cronometrar(montar_emails), len(registros))
+
+    novo_banco(f"envio-{n}")
+    app.salvar_tokens(registros)
+    jobs_envio.JOB_INTERVALO_GRAVACAO = 1
+
+    def enviar():
+        job = jobs_envio.JobEnvio("benchmark")
+        armazenamento.criar_job(job.estado)
+        preparar = partial(app.preparar_email_formulario, modelo=modelo)
+        jobs_envio.executar_envio(job, "tokens", preparar, ("remetente@example.com", "x", "localhost", 25), reenviar=True)
+
+    registrar("envio completo (SMTP local)", cronometrar(enviar), len(registros))
+
+    def upload(conteudo, nome_arquivo):
+        resposta = cliente.post(
+            "/upload", data={"file": (io.BytesIO(conteudo), nome_arquivo), "formato": "json"}
+        )
+        assert resposta.status_code == 200, resposta.get_data(as_text=True)
+
+    if n <= args.max_upload:
+        novo_banco(f"upload-{n}")
+        conteudo = planilha_csv(n)
+        registrar("POST /upload (CSV)", cronometrar(lambda: upload(conteudo, "planilha.csv")), n)
+
+    if n <= args.max_xlsx:
+        novo_banco(f"upload-xlsx-{n}")
+        conteudo = planilha_xlsx(n)
+        registrar("POST /upload (xlsx)", cronometrar(lambda: upload(conteudo, "planilha.xlsx")), n)
+
+
+def medir_inicializacao(args, resultados):
+    # Processo novo importando o app, como um worker do gunicorn subindo a frio.
+    ambiente_processo = {**os.environ, "TOKENS_DB_FILE": os.path.join(PASTA, "inicializacao.db")}
+    codigo = "import sys, app; print('pesados=' + ','.join(m for m in app.MODULOS_PESADOS if m in sys.modules))"
+
+    def importar():
+        saida = subprocess.run(
+            [sys.executable, "-c", codigo], cwd=RAIZ, env=ambiente_processo, capture_output=True, text=True, check=True
+        )
+        return saida.stdout.rsplit("pesados=", 1)[-1].strip()
+
+    segundos = cronometrar(importar, args.repeticoes)
+    pesados = importar()
+    resultados.append({
+        "tamanho": None, "operacao": "importar app (processo novo)", "segundos": round(segundos, 6),
+        "itens": 1, "us_por_item": round(segundos * 1e6, 3), "modulos_pesados": pesados or None,
+    })
+    print(f"🚀 importar app (processo novo): {segundos:.4f} s (módulos pesados: {pesados or 'nenhum'})")
+
+
+def ambiente():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "processador": platform.processor() or platform.machine(),
+        "executado_em": datetime.now().isoformat(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks dos caminhos quentes")
+    parser.add_argument("--tamanhos", default="1000,10000,100000", help="ex.: 1000,10000,100000,1000000")
+    parser.add_argument("--repeticoes", type=int, default=3, help="repetições das medições rápidas (vale a melhor)")
+    parser.add_argument("--max-emails", type=int, default=10000, help="limite de e-mails montados/enviados por tamanho")
+    parser.add_argument("--max-upload", type=int, default=1000000, help="maior tamanho com benchmark de upload CSV")
+    parser.add_argument(
+        "--max-xlsx", type=int, default=1000000, help="maior tamanho com benchmark de upload xlsx (a planilha é gerada antes)"
+    )
+    parser.add_argument("--saida", help="arquivo JSON com os resultados")
+    args = parser.parse_args()
+
+    smtplib.SMTP = SMTPLocal
+    resultados = []
+    medir_inicializacao(args, resultados)
+    for tamanho in (int(t) for t in args.tamanhos.split(",")):
+        medir_tamanho(tamanho, args, resultados)
+
+    relatorio = {"ambiente": ambiente(), "resultados": resultados}
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados gravados em {args.saida}")
+    else:
+        print(json.dumps(relatorio, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import sys
+import json
+
+import arquivo_tokens
+
+# Uso:
+#   python compactar_tokens.py                                  move tokens usados/expirados e LeaderTrack inativos para o arquivo morto
+#   python compactar_tokens.py consultar <colecao> [campo=valor ...]   consulta o arquivo morto (ex.: codrodada=R1 email=a@b.com)
+
+if len(sys.argv) >= 3 and sys.argv[1] == "consultar":
+    tabela = sys.argv[2]
+    if tabela not in arquivo_tokens.COLECOES_ARQUIVAVEIS:
+        print(f"❌ Coleção sem arquivo morto: {tabela}")
+        sys.exit(1)
+
+    filtros = dict(argumento.split("=", 1) for argumento in sys.argv[3:])
+    for registro in arquivo_tokens.consultar_arquivo(tabela, **filtros):
+        print(json.dumps(registro, ensure_ascii=False))
+
+elif len(sys.argv) == 1:
+    resultado = arquivo_tokens.compactar()
+    print(f"✅ Compactação concluída: {resultado}")
+
+else:
+    print("❌ Uso: python compactar_tokens.py [consultar <colecao> [campo=valor ...]]")
+    sys.exit(1)
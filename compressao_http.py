@@ -0,0 +1,95 @@
+import os
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele as respostas saem só em gzip
+    brotli = None
+
+# Compressão das respostas grandes (listagens, NDJSON, painel), conforme o Accept-Encoding
+# do cliente: br quando o pacote brotli está instalado, senão gzip.
+
+COMPRESSAO_MINIMO = int(os.environ.get("COMPRESSAO_MINIMO", "1024"))
+COMPRESSAO_NIVEL_GZIP = int(os.environ.get("COMPRESSAO_NIVEL_GZIP", "6"))
+COMPRESSAO_NIVEL_BROTLI = int(os.environ.get("COMPRESSAO_NIVEL_BROTLI", "5"))
+
+# Em streaming o compressor é esvaziado a cada tanto de entrada, para o cliente continuar
+# recebendo os itens aos poucos em vez de tudo no final.
+COMPRESSAO_DESCARGA_BYTES = 64 * 1024
+
+TIPOS_COMPRIMIVEIS = ("text/html", "text/plain", "application/json", "application/x-ndjson")
+# text/plain em streaming é o acompanhamento do log do envio: cada linha tem que sair na hora.
+TIPOS_STREAMING = ("text/html", "application/x-ndjson")
+
+
+def escolher_codificacao(aceitas):
+    # `aceitas` é o request.accept_encodings do Flask (respeita q=0).
+    if brotli is not None and aceitas["br"]:
+        return "br"
+    if aceitas["gzip"]:
+        return "gzip"
+    return None
+
+
+def _comprimir_partes(partes, codificacao):
+    if codificacao == "br":
+        compressor = brotli.Compressor(quality=COMPRESSAO_NIVEL_BROTLI)
+        comprimir, descarregar, finalizar = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESSAO_NIVEL_GZIP, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        comprimir, finalizar = compressor.compress, compressor.flush
+
+        def descarregar():
+            return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    pendente = 0
+    try:
+        for parte in partes:
+            if isinstance(parte, str):
+                parte = parte.encode("utf-8")
+            dados = comprimir(parte)
+            pendente += len(parte)
+            if pendente >= COMPRESSAO_DESCARGA_BYTES:
+                dados += descarregar()
+                pendente = 0
+            if dados:
+                yield dados
+        yield finalizar()
+    finally:
+        # Fecha o gerador original (e o contexto da requisição que ele segura) junto com este.
+        if hasattr(partes, "close"):
+            partes.close()
+
+
+def comprimir(response, aceitas):
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in TIPOS_COMPRIMIVEIS
+    ):
+        return response
+
+    if response.is_streamed and response.mimetype not in TIPOS_STREAMING:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    codificacao = escolher_codificacao(aceitas)
+    if codificacao is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _comprimir_partes(response.response, codificacao)
+        response.headers.pop("Content-Length", None)
+    else:
+        dados = response.get_data()
+        if len(dados) < COMPRESSAO_MINIMO:
+            return response
+        if codificacao == "br":
+            response.set_data(brotli.compress(dados, quality=COMPRESSAO_NIVEL_BROTLI))
+        else:
+            response.set_data(gzip.compress(dados, COMPRESSAO_NIVEL_GZIP))
+
+    response.headers["Content-Encoding"] = codificacao
+    return response
@@ -0,0 +1,181 @@
+import os
+import time
+import email
+import smtplib
+import argparse
+import threading
+from datetime import datetime
+
+import armazenamento
+import metricas
+from envio_email import (
+    CAIXA_SAIDA_DIR, CABECALHO_CHAVE, CABECALHO_DESTINATARIO, CABECALHO_TABELA, SessaoSMTP, obter_config_email,
+)
+from jobs_envio import em_ordem
+
+# Entrega por SMTP as mensagens gravadas na caixa de saída (TRANSPORTE_EMAIL=caixa_saida).
+#
+#   python drenar_caixa_saida.py [--trabalhadores 4] [--tentativas 3] [--continuo]
+#
+# Cada mensagem é reivindicada movendo o arquivo de new/ para cur/ (rename atômico), então
+# vários processos de drenagem podem rodar juntos sem entregar a mesma mensagem duas vezes.
+# Entregue, o arquivo é apagado e o registro recebe entregue_em; depois de esgotar as
+# tentativas, o arquivo vai para falhas/ e o registro volta a pendente (enviado=False).
+
+GRAVAR_A_CADA = 50
+
+
+def reivindicar(pasta):
+    for nome in sorted(os.listdir(os.path.join(pasta, "new"))):
+        origem = os.path.join(pasta, "new", nome)
+        destino = os.path.join(pasta, "cur", nome)
+        try:
+            # O rename preserva o mtime, que em cur/ passa a ser a hora da reivindicação
+            # (ver recuperar_abandonadas). Atualizado antes do rename, a mensagem nunca
+            # aparece em cur/ com a hora em que foi gravada na caixa de saída.
+            os.utime(origem)
+            os.rename(origem, destino)
+        except FileNotFoundError:
+            continue  # outro processo pegou antes
+        yield destino
+
+
+def recuperar_abandonadas(pasta, segundos):
+    # Mensagens em cur/ sem atividade há muito tempo (mtime = reivindicação ou última
+    # tentativa de entrega) ficaram de um processo que caiu no meio da entrega.
+    limite = time.time() - segundos
+    for nome in os.listdir(os.path.join(pasta, "cur")):
+        caminho = os.path.join(pasta, "cur", nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.rename(caminho, os.path.join(pasta, "new", nome))
+                print(f"♻️ Mensagem devolvida para a fila: {nome}")
+        except FileNotFoundError:
+            continue
+
+
+def permanente(erro):
+    # Respostas 5xx (destinatário recusado, mensagem rejeitada) não adiantam repetir.
+    if isinstance(erro, smtplib.SMTPRecipientsRefused):
+        return all(codigo >= 500 for codigo, _ in erro.recipients.values())
+    return isinstance(erro, smtplib.SMTPResponseException) and erro.smtp_code >= 500
+
+
+def drenar(pasta, trabalhadores, tentativas, espera):
+    remetente, senha, smtp_server, porta = obter_config_email()
+    local = threading.local()
+    sessoes = []
+    sessoes_lock = threading.Lock()
+
+    def sessao():
+        if not hasattr(local, "smtp"):
+            local.smtp = SessaoSMTP(remetente, senha, smtp_server, porta)
+            with sessoes_lock:
+                sessoes.append(local.smtp)
+        return local.smtp
+
+    def entregar(caminho):
+        try:
+            with open(caminho, "rb") as f:
+                msg = email.message_from_binary_file(f)
+        except FileNotFoundError:
+            return None  # devolvida à fila e pega por outro processo antes de abrirmos
+
+        destinatario = msg[CABECALHO_DESTINATARIO] or msg["To"]
+        referencia = (msg[CABECALHO_TABELA], msg[CABECALHO_CHAVE])
+        for cabecalho in (CABECALHO_DESTINATARIO, CABECALHO_TABELA, CABECALHO_CHAVE):
+            del msg[cabecalho]
+
+        # Só o envio SMTP é repetido; o que vem depois dele nunca provoca um novo envio.
+        erro = None
+        for tentativa in range(1, tentativas + 1):
+            try:
+                os.utime(caminho)  # sinal de vida para recuperar_abandonadas
+            except FileNotFoundError:
+                pass
+            try:
+                sessao().enviar(destinatario, msg)
+                erro = None
+                break
+            except Exception as e:
+                erro = e
+                if permanente(e) or tentativa == tentativas:
+                    break
+                time.sleep(espera * 2 ** (tentativa - 1))
+
+        # FileNotFoundError aqui: outro processo já tratou o arquivo; não há o que desfazer.
+        try:
+            if erro is None:
+                os.remove(caminho)
+            else:
+                os.makedirs(os.path.join(pasta, "falhas"), exist_ok=True)
+                os.rename(caminho, os.path.join(pasta, "falhas", os.path.basename(caminho)))
+        except FileNotFoundError:
+            pass
+        return referencia, destinatario, str(erro) if erro else None
+
+    pendentes = {}
+    contagem = {"entregues": 0, "falhas": 0}
+
+    def gravar():
+        for tabela, alteracoes in pendentes.items():
+            if alteracoes and tabela in armazenamento.COLECOES:
+                armazenamento.atualizar_registros(tabela, alteracoes)
+        pendentes.clear()
+
+    try:
+        # em_ordem reivindica só uma janela de mensagens por vez, deixando o resto da fila
+        # para outros processos de drenagem.
+        for entrega in em_ordem(entregar, reivindicar(pasta), trabalhadores):
+            if entrega is None:
+                continue
+            (tabela, chave), destinatario, erro = entrega
+            if erro:
+                print(f"❌ Falha ao entregar para {destinatario}: {erro}")
+                campos = {"enviado": False, "erro": erro}
+                resultado = "falhas"
+            else:
+                print(f"✅ Entregue para {destinatario}")
+                campos = {"entregue_em": datetime.now().isoformat(), "erro": None}
+                resultado = "entregues"
+            contagem[resultado] += 1
+            metricas.incrementar("envio_emails_total", campanha=tabela or "caixa_saida", resultado=resultado)
+
+            if tabela and chave:
+                pendentes.setdefault(tabela, []).append((chave, campos))
+                if sum(len(a) for a in pendentes.values()) >= GRAVAR_A_CADA:
+                    gravar()
+    finally:
+        gravar()
+        for smtp in sessoes:
+            smtp.fechar()
+
+    return contagem
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrega por SMTP as mensagens da caixa de saída")
+    parser.add_argument("--pasta", default=CAIXA_SAIDA_DIR)
+    parser.add_argument("--trabalhadores", type=int, default=int(os.environ.get("DRENAGEM_TRABALHADORES", "4")))
+    parser.add_argument("--tentativas", type=int, default=int(os.environ.get("DRENAGEM_TENTATIVAS", "3")))
+    parser.add_argument("--espera", type=float, default=2.0, help="espera inicial entre tentativas (dobra a cada uma)")
+    parser.add_argument("--continuo", action="store_true", help="continua olhando a caixa de saída")
+    parser.add_argument("--intervalo", type=float, default=5.0, help="segundos entre verificações no modo contínuo")
+    parser.add_argument("--recuperar-apos", type=float, default=600, help="devolve à fila mensagens presas em cur/ há mais que isso")
+    args = parser.parse_args()
+
+    for sub in ("tmp", "new", "cur"):
+        os.makedirs(os.path.join(args.pasta, sub), exist_ok=True)
+
+    while True:
+        recuperar_abandonadas(args.pasta, args.recuperar_apos)
+        contagem = drenar(args.pasta, args.trabalhadores, args.tentativas, args.espera)
+        if contagem["entregues"] or contagem["falhas"]:
+            print(f"📬 Entregues: {contagem['entregues']} | ❌ Falhas: {contagem['falhas']}")
+        if not args.continuo:
+            break
+        time.sleep(args.intervalo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import ssl
+import mailbox
+import smtplib
+
+import metricas
+
+SMTP_MAX_MENSAGENS_POR_CONEXAO = int(os.environ.get("SMTP_MAX_MENSAGENS_POR_CONEXAO", "100"))
+SMTP_TIMEOUT = int(os.environ.get("SMTP_TIMEOUT", "60"))
+
+# Transporte usado pelos envios: "smtp" entrega direto; "caixa_saida" só grava as mensagens
+# prontas num Maildir (CAIXA_SAIDA_DIR), e a entrega fica com drenar_caixa_saida.py.
+TRANSPORTE_EMAIL = os.environ.get("TRANSPORTE_EMAIL", "smtp")
+CAIXA_SAIDA_DIR = os.environ.get(
+    "CAIXA_SAIDA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "caixa_saida")
+)
+
+# Cabeçalhos internos da caixa de saída (removidos antes da entrega).
+CABECALHO_DESTINATARIO = "X-Caixa-Saida-Destinatario"
+CABECALHO_TABELA = "X-Caixa-Saida-Tabela"
+CABECALHO_CHAVE = "X-Caixa-Saida-Chave"
+
+
+# Fica aqui (e não no app) para que drenar_caixa_saida.py use as mesmas credenciais sem
+# carregar o Flask.
+def obter_config_email():
+    remetente = "marceloesteves@thehrkey.tech"
+    senha_remetente = "1Tub@r@o110368"
+    smtp_server = "smtp.titan.email"
+    porta = 587
+    return remetente, senha_remetente, smtp_server, porta
+
+
+class SessaoSMTP:
+    # Mantém uma única conexão autenticada (EHLO + STARTTLS + LOGIN) para vários envios.
+    # Reconecta quando o servidor derruba a sessão ou depois de max_mensagens envios.
+
+    def __init__(self, remetente, senha, smtp_server, porta, max_mensagens=None):
+        self.remetente = remetente
+        self.senha = senha
+        self.smtp_server = smtp_server
+        self.porta = porta
+        self.max_mensagens = max_mensagens or SMTP_MAX_MENSAGENS_POR_CONEXAO
+        self.server = None
+        self.enviadas_na_conexao = 0
+        self.conexoes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def conectar(self):
+        self.fechar()
+        with metricas.medir("smtp_duracao_segundos", "smtp_erros_total", etapa="conectar"):
+            server = smtplib.SMTP(self.smtp_server, self.porta, timeout=SMTP_TIMEOUT)
+        try:
+            with metricas.medir("smtp_duracao_segundos", "smtp_erros_total", etapa="starttls"):
+                server.ehlo()
+                server.starttls(context=ssl.create_default_context())
+                server.ehlo()
+            with metricas.medir("smtp_duracao_segundos", "smtp_erros_total", etapa="login"):
+                server.login(self.remetente, self.senha)
+        except Exception:
+            server.close()
+            raise
+
+        self.server = server
+        self.enviadas_na_conexao = 0
+        self.conexoes += 1
+
+    def fechar(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+    def _sendmail(self, destinatario, msg):
+        with metricas.medir("smtp_duracao_segundos", "smtp_erros_total", etapa="enviar"):
+            self.server.sendmail(self.remetente, destinatario, msg.as_string())
+
+    def enviar(self, destinatario, msg, referencia=None):
+        if self.server is None or self.enviadas_na_conexao >= self.max_mensagens:
+            self.conectar()
+
+        try:
+            self._sendmail(destinatario, msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self.conectar()
+            self._sendmail(destinatario, msg)
+        except smtplib.SMTPResponseException as e:
+            # 421: o servidor está encerrando a sessão; a mensagem não foi aceita.
+            if e.smtp_code != 421:
+                raise
+            self.conectar()
+            self._sendmail(destinatario, msg)
+
+        self.enviadas_na_conexao += 1
+
+
+class CaixaSaida:
+    # Mesma interface da SessaoSMTP, mas só grava a mensagem no Maildir (tmp/ e depois
+    # new/, de forma atômica). `referencia` = (tabela, chave) do registro, para que a
+    # drenagem registre a entrega ou a falha nele.
+
+    def __init__(self, pasta=None):
+        self.caixa = mailbox.Maildir(pasta or CAIXA_SAIDA_DIR, create=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def enviar(self, destinatario, msg, referencia=None):
+        msg[CABECALHO_DESTINATARIO] = destinatario
+        if referencia:
+            msg[CABECALHO_TABELA], msg[CABECALHO_CHAVE] = referencia[0], str(referencia[1])
+        self.caixa.add(msg)
+
+    def fechar(self):
+        pass
+
+
+def criar_transporte(config_smtp, transporte=None):
+    transporte = transporte or TRANSPORTE_EMAIL
+    if transporte == "caixa_saida":
+        return CaixaSaida()
+    if transporte != "smtp":
+        raise ValueError(f"Transporte de e-mail desconhecido: {transporte}")
+    return SessaoSMTP(*config_smtp)
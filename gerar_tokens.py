@@ -1,11 +1,17 @@
 import pandas as pd
 import uuid
-import json
 from datetime import datetime, timedelta
 
-# Caminhos dos arquivos
+import armazenamento
+
+# Gera os tokens da planilha e grava direto no banco (tokens.db), substituindo os tokens
+# atuais, como o tokens.json fazia antes. O app não lê mais o tokens.json depois que o
+# banco existe, por isso o arquivo não é mais gerado.
+#
+#   python gerar_tokens.py
+
+# Caminho da planilha
 ARQUIVO_EXCEL = "cadastro_usuarios_tokens.xlsx"
-ARQUIVO_TOKENS = "tokens.json"
 
 # Leitura da planilha
 df = pd.read_excel(ARQUIVO_EXCEL)
@@ -28,8 +34,7 @@ for _, row in df.iterrows():
     }
     tokens.append(token_info)
 
-# Salva no tokens.json
-with open(ARQUIVO_TOKENS, "w", encoding="utf-8") as f:
-    json.dump(tokens, f, indent=2, ensure_ascii=False)
+# Salva no banco numa única transação: quem estiver lendo vê os tokens antigos ou os novos.
+total = armazenamento.salvar_registros("tokens", tokens)
 
-print("✅ tokens.json gerado com sucesso.")
+print(f"✅ {total} tokens gerados e salvos no banco de tokens.")
@@ -0,0 +1,26 @@
+import sys
+
+import armazenamento
+
+# Uso: python importar_tokens.py [colecao caminho.json]
+# Sem argumentos, reimporta todos os arquivos JSON conhecidos, substituindo o conteúdo do banco.
+
+if len(sys.argv) == 3:
+    alvos = [(sys.argv[1], sys.argv[2])]
+else:
+    alvos = [(tabela, config["arquivo_json"]) for tabela, config in armazenamento.COLECOES.items()]
+
+for tabela, caminho in alvos:
+    if tabela not in armazenamento.COLECOES:
+        print(f"❌ Coleção desconhecida: {tabela}")
+        sys.exit(1)
+
+    try:
+        total = armazenamento.importar_json(tabela, caminho, substituir=True)
+        print(f"✅ {total} registros importados de {caminho} para {tabela}")
+    except FileNotFoundError:
+        print(f"⏭️ Arquivo não encontrado, pulando: {caminho}")
+    except ValueError as e:
+        # json.JSONDecodeError também é ValueError; a coleção fica como estava.
+        print(f"❌ {e} Nada foi alterado em {tabela}.")
+        sys.exit(1)
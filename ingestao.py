@@ -0,0 +1,273 @@
+import os
+import codecs
+from datetime import datetime, timedelta
+
+import rotas_formulario
+
+# Etapa única de ingestão usada pelas rotas de upload: normaliza as colunas da
+# planilha de uma vez (sem iterrows), remove duplicados e gera os tokens em lote.
+#
+# pandas (com numpy) e openpyxl são importados dentro das funções, no primeiro upload:
+# importar este módulo não os carrega, e os workers que só atendem tokens sobem sem eles.
+
+# Linhas por bloco na leitura em streaming; a memória usada não depende do tamanho da planilha.
+INGESTAO_TAMANHO_BLOCO = int(os.environ.get("INGESTAO_TAMANHO_BLOCO", "5000"))
+
+CHAVE_FORMULARIO = ["email", "codrodada", "produto", "tipo"]
+CHAVE_LEADERTRACK = "emailLider"
+CHAVE_LEADERTRACK_RODADA = ["empresa", "codrodada", "emailLider"]
+SEPARADOR_CHAVE = "\x1f"
+
+
+def gerar_tokens(quantidade):
+    # Mesmo formato de uuid.uuid4().hex (32 caracteres hex), mas com uma única leitura de os.urandom.
+    bruto = os.urandom(16 * quantidade).hex()
+    return [bruto[i:i + 32] for i in range(0, 32 * quantidade, 32)]
+
+
+def _celula(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def ler_xlsx_em_blocos(file, tamanho_bloco=None):
+    # Modo read_only do openpyxl: as linhas são lidas do XML sob demanda, sem montar
+    # a planilha inteira nem um DataFrame único em memória.
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    tamanho_bloco = tamanho_bloco or INGESTAO_TAMANHO_BLOCO
+    wb = load_workbook(getattr(file, "stream", file), read_only=True, data_only=True)
+    try:
+        linhas = wb.active.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+
+        colunas = [_celula(c).strip() or f"coluna_{i}" for i, c in enumerate(cabecalho)]
+        bloco = []
+        indice = []
+        # O índice do DataFrame segue a numeração dos dados no CSV (linha da planilha - 2),
+        # para que os relatórios de linhas puladas apontem a linha certa.
+        for numero, linha in enumerate(linhas):
+            if all(v is None for v in linha):
+                continue
+            bloco.append([_celula(v) for v in linha])
+            indice.append(numero)
+            if len(bloco) >= tamanho_bloco:
+                yield pd.DataFrame(bloco, columns=colunas, index=indice)
+                bloco = []
+                indice = []
+
+        if bloco:
+            yield pd.DataFrame(bloco, columns=colunas, index=indice)
+    finally:
+        wb.close()
+
+
+def _detectar_codificacao(stream):
+    # Valida o arquivo como UTF-8 em pedaços (sem carregá-lo inteiro); se falhar, latin1.
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while True:
+            pedaco = stream.read(1 << 20)
+            if not pedaco:
+                decoder.decode(b"", final=True)
+                return "utf-8-sig"
+            decoder.decode(pedaco)
+    except UnicodeDecodeError:
+        return "latin1"
+    finally:
+        stream.seek(0)
+
+
+def _detectar_separador(stream, codificacao):
+    # Planilhas exportadas pelo Excel em português costumam usar ";".
+    primeira_linha = stream.readline().decode(codificacao, errors="replace")
+    stream.seek(0)
+    return ";" if primeira_linha.count(";") > primeira_linha.count(",") else ","
+
+
+def ler_csv_em_blocos(file, tamanho_bloco=None):
+    import pandas as pd
+
+    stream = getattr(file, "stream", file)
+    codificacao = _detectar_codificacao(stream)
+    separador = _detectar_separador(stream, codificacao)
+
+    leitor = pd.read_csv(
+        stream,
+        dtype=str,
+        encoding=codificacao,
+        sep=separador,
+        keep_default_na=False,
+        chunksize=tamanho_bloco or INGESTAO_TAMANHO_BLOCO,
+    )
+    with leitor:
+        for bloco in leitor:
+            bloco.columns = [str(c).strip() for c in bloco.columns]
+            yield bloco
+
+
+def ler_planilha_em_blocos(file, tamanho_bloco=None):
+    nome_arquivo = (file.filename or "").lower()
+
+    if nome_arquivo.endswith(".csv"):
+        return ler_csv_em_blocos(file, tamanho_bloco)
+
+    return ler_xlsx_em_blocos(file, tamanho_bloco)
+
+
+def preparar_em_blocos(blocos, preparar, vistos, resultado):
+    # Aplica `preparar` bloco a bloco, acumulando as linhas puladas em resultado["pulados"].
+    for df in blocos:
+        registros, pulados = preparar(df, vistos)
+        resultado["pulados"].extend(pulados)
+        yield registros
+
+
+def _texto(df, coluna, padrao=""):
+    import pandas as pd
+
+    if coluna not in df.columns:
+        return pd.Series(padrao, index=df.index, dtype=object)
+    return df[coluna].fillna("").astype(str).str.strip()
+
+
+def _email(df, coluna):
+    return _texto(df, coluna).str.lower()
+
+
+def chave_texto(valores):
+    return SEPARADOR_CHAVE.join("" if v is None else str(v).strip() for v in valores)
+
+
+def _chaves(saida, chave):
+    if not isinstance(chave, list):
+        return saida[chave]
+    chaves = saida[chave[0]]
+    for coluna in chave[1:]:
+        chaves = chaves + SEPARADOR_CHAVE + saida[coluna]
+    return chaves
+
+
+def _pulados(chaves, motivo):
+    return [
+        {"linha": int(i) + 2, "chave": c.replace(SEPARADOR_CHAVE, " / "), "motivo": motivo}
+        for i, c in chaves.items()
+    ]
+
+
+def _remover_invalidos(saida, invalidos, chave, motivo, pulados):
+    pulados.extend(_pulados(_chaves(saida[invalidos], chave), motivo))
+    return saida[~invalidos]
+
+
+def _remover_duplicados(saida, chave, vistos, existentes, pulados):
+    # `vistos` guarda as chaves já aceitas desta planilha (e é atualizado, para funcionar
+    # quando a planilha chega em blocos); `existentes`, as chaves que já estão no banco.
+    chaves = _chaves(saida, chave)
+    existe = chaves.isin(existentes)
+    repetido = ~existe & (chaves.duplicated() | chaves.isin(vistos))
+    novos = ~existe & ~repetido
+
+    vistos.update(chaves[novos])
+    pulados.extend(_pulados(chaves[existe], "já existe no banco"))
+    pulados.extend(_pulados(chaves[repetido], "repetido na planilha"))
+    return saida[novos]
+
+
+def preparar_tokens_formulario(df, vistos=None, existentes=(), dias_validade=2):
+    import pandas as pd
+
+    vistos = set() if vistos is None else vistos
+
+    saida = pd.DataFrame({
+        "nome": _texto(df, "nome"),
+        "email": _email(df, "email"),
+        "empresa": _texto(df, "company"),
+        "codrodada": _texto(df, "codrodada"),
+        "produto": _texto(df, "produto"),
+        "tipo": _texto(df, "tipo"),
+        "nomeLider": _texto(df, "nomeLider"),
+        "emailLider": _email(df, "emailLider"),
+    })
+    pulados = []
+    saida = _remover_duplicados(saida, CHAVE_FORMULARIO, vistos, existentes, pulados)
+
+    # Chaves de roteamento normalizadas e URL base: a normalização roda uma vez por
+    # combinação (produto, tipo) da planilha, não por linha nem a cada acesso.
+    pares = list(zip(saida["produto"], saida["tipo"]))
+    rotas = {par: rotas_formulario.campos_rota(*par) for par in set(pares)}
+    for campo in rotas_formulario.CAMPOS_ROTA:
+        saida[campo] = pd.Series([rotas[par][campo] for par in pares], index=saida.index, dtype=object)
+
+    saida = saida.assign(
+        token=gerar_tokens(len(saida)),
+        expira_em=(datetime.now() + timedelta(days=dias_validade)).isoformat(),
+        usado=False,
+    )
+    return saida.to_dict("records"), pulados
+
+
+def preparar_tokens_leadertrack(df, vistos=None, existentes=(), chave=CHAVE_LEADERTRACK):
+    import pandas as pd
+
+    vistos = set() if vistos is None else vistos
+
+    email_lider = _email(df, "emailLider")
+    email_envio = _email(df, "emailEnvio")
+
+    saida = pd.DataFrame({
+        "nomeLider": _texto(df, "nomeLider"),
+        "emailLider": email_lider,
+        "emailEnvio": email_envio.mask(email_envio == "", email_lider),
+        "empresa": _texto(df, "company"),
+        "codrodada": _texto(df, "codrodada"),
+    })
+    pulados = []
+    saida = _remover_invalidos(saida, saida["emailLider"] == "", chave, "emailLider vazio", pulados)
+    saida = _remover_duplicados(saida, chave, vistos, existentes, pulados)
+
+    saida = saida.assign(
+        token=gerar_tokens(len(saida)),
+        criado_em=datetime.now().isoformat(),
+        ativo=True,
+    )
+    return saida.to_dict("records"), pulados
+
+
+def preparar_usuarios_portal(df, vistos=None):
+    import pandas as pd
+
+    vistos = set() if vistos is None else vistos
+
+    email = _email(df, "user_email") if "user_email" in df.columns else _email(df, "email")
+    first_name = _texto(df, "first_name")
+    display_name = _texto(df, "display_name")
+
+    display_name = display_name.mask(display_name == "", first_name)
+    display_name = display_name.mask(display_name == "", email.str.split("@").str[0])
+    first_name = first_name.mask(first_name == "", display_name.str.split(" ").str[0])
+    first_name = first_name.mask(first_name == "", "Olá")
+
+    saida = pd.DataFrame({
+        "user_email": email,
+        "first_name": first_name,
+        "display_name": display_name,
+    })
+    pulados = []
+    invalidos = ~saida["user_email"].str.contains("@", regex=False)
+    saida = _remover_invalidos(saida, invalidos, "user_email", "e-mail inválido", pulados)
+    saida = _remover_duplicados(saida, "user_email", vistos, (), pulados)
+
+    saida = saida.assign(
+        carregado_em=datetime.now().isoformat(),
+        enviado=False,
+        enviado_em=None,
+        erro=None,
+    )
+    return saida.to_dict("records"), pulados
@@ -0,0 +1,215 @@
+import os
+import time
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import armazenamento
+import metricas
+import envio_email
+
+# Intervalo mínimo entre gravações do progresso do job no banco.
+JOB_INTERVALO_GRAVACAO = float(os.environ.get("JOB_INTERVALO_GRAVACAO", "1"))
+# Um job "executando" sem atualização há mais tempo que isso é considerado abandonado
+# (por exemplo, o worker do gunicorn foi reciclado no meio do envio).
+JOB_TIMEOUT_ABANDONO = timedelta(minutes=5)
+# Quantidade de conexões SMTP enviando em paralelo dentro de um job (1 = sequencial).
+ENVIO_TRABALHADORES = int(os.environ.get("ENVIO_TRABALHADORES", "4"))
+# O estado de entrega (enviado/enviado_em/erro) de cada destinatário é gravado no banco
+# a cada CHECKPOINT_A_CADA mensagens ou CHECKPOINT_INTERVALO segundos, o que vier antes.
+CHECKPOINT_A_CADA = int(os.environ.get("CHECKPOINT_A_CADA", "50"))
+CHECKPOINT_INTERVALO = float(os.environ.get("CHECKPOINT_INTERVALO", "10"))
+
+
+class JobEnvio:
+    def __init__(self, tipo):
+        agora = datetime.now().isoformat()
+        self.estado = {
+            "id": uuid.uuid4().hex[:12],
+            "tipo": tipo,
+            "status": "na fila",
+            "total": 0,
+            "enviados": 0,
+            "pulados": 0,
+            "erros": 0,
+            "resumo": "",
+            "criado_em": agora,
+            "atualizado_em": agora,
+        }
+        self.logs_pendentes = []
+        self.proxima_seq = 0
+        self.ultima_gravacao = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def id(self):
+        return self.estado["id"]
+
+    def log(self, *linhas):
+        with self.lock:
+            self.logs_pendentes.extend(linhas)
+        self.gravar()
+
+    def contar(self, campo, linhas=()):
+        with self.lock:
+            self.estado[campo] += 1
+            self.logs_pendentes.extend(linhas)
+        self.gravar()
+
+    def gravar(self, forcar=False):
+        with self.lock:
+            if not forcar and time.monotonic() - self.ultima_gravacao < JOB_INTERVALO_GRAVACAO:
+                return
+            self.ultima_gravacao = time.monotonic()
+            self.estado["atualizado_em"] = datetime.now().isoformat()
+            linhas, self.logs_pendentes = self.logs_pendentes, []
+            primeira_seq = self.proxima_seq
+            self.proxima_seq += len(linhas)
+            armazenamento.atualizar_job(dict(self.estado), linhas, primeira_seq)
+
+    def finalizar(self, status):
+        e = self.estado
+        e["status"] = status
+        e["resumo"] = (
+            f"✅ Enviados: {e['enviados']} | ⏭️ Pulados: {e['pulados']} | "
+            f"❌ Erros: {e['erros']} | 📦 Total: {e['total']}"
+        )
+        self.gravar(forcar=True)
+
+
+def iniciar_job(tipo, alvo):
+    # Se já houver um job ativo desse tipo (em qualquer worker), devolve o id dele em vez
+    # de disparar um segundo envio em paralelo.
+    job = JobEnvio(tipo)
+    limite = (datetime.now() - JOB_TIMEOUT_ABANDONO).isoformat()
+    job_id = armazenamento.criar_job(job.estado, exclusivo_desde=limite)
+    if job_id != job.id:
+        return job_id
+
+    def executar():
+        try:
+            alvo(job)
+            job.finalizar("concluído")
+        except Exception as e:
+            job.log(f"❌ Erro fatal no envio: {e}")
+            job.finalizar("falhou")
+
+    threading.Thread(target=executar, name=f"job-envio-{job.id}", daemon=True).start()
+    return job.id
+
+
+def em_ordem(funcao, itens, trabalhadores):
+    # Como map(), mas com no máximo `trabalhadores` threads e uma janela limitada de
+    # tarefas pendentes; os resultados saem na ordem de entrada.
+    if trabalhadores <= 1:
+        yield from map(funcao, itens)
+        return
+
+    with ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="envio-smtp") as executor:
+        pendentes = deque()
+        for item in itens:
+            pendentes.append(executor.submit(funcao, item))
+            if len(pendentes) >= trabalhadores * 4:
+                yield pendentes.popleft().result()
+        while pendentes:
+            yield pendentes.popleft().result()
+
+
+class _Checkpoint:
+    def __init__(self, tabela):
+        self.tabela = tabela
+        self.chave = armazenamento.COLECOES[tabela]["chave"]
+        self.pendentes = []
+        self.ultimo = time.monotonic()
+
+    def marcar(self, registro, campos):
+        registro.update(campos)
+        self.pendentes.append((registro.get(self.chave), campos))
+        if len(self.pendentes) >= CHECKPOINT_A_CADA or time.monotonic() - self.ultimo >= CHECKPOINT_INTERVALO:
+            self.gravar()
+
+    def gravar(self):
+        if self.pendentes:
+            armazenamento.atualizar_registros(self.tabela, self.pendentes)
+            self.pendentes = []
+        self.ultimo = time.monotonic()
+
+
+def executar_envio(job, tabela, preparar, config_smtp, reenviar=False, trabalhadores=None, transporte=None):
+    # preparar(i, registro, remetente, logs) devolve (destinatario, msg) ou None para pular.
+    # Registros já marcados como enviados são ignorados, para que um envio interrompido
+    # continue de onde parou; reenviar=True manda para todos novamente.
+    # Os registros são lidos do banco em lotes durante o envio, sem carregar a coleção inteira.
+    # Com o transporte "caixa_saida", "enviado" significa gravado na caixa de saída; a
+    # drenagem registra a entrega (entregue_em) ou devolve o registro a pendente.
+    remetente, _, smtp_server, porta = config_smtp
+    trabalhadores = trabalhadores or ENVIO_TRABALHADORES
+    transporte = transporte or envio_email.TRANSPORTE_EMAIL
+    chave = armazenamento.COLECOES[tabela]["chave"]
+
+    total = armazenamento.contar_registros(tabela)
+    ja_enviados = 0 if reenviar else armazenamento.contar_registros(tabela, {"enviado": True})
+
+    job.estado["status"] = "executando"
+    job.estado["total"] = total
+    job.estado["pulados"] += ja_enviados
+    job.log(
+        f"📦 Total de registros carregados: {total}",
+        f"📨 Remetente configurado: {remetente}",
+        f"🌐 Transporte: {transporte} | SMTP: {smtp_server}:{porta} | 🧵 Conexões em paralelo: {trabalhadores}",
+    )
+    if ja_enviados:
+        job.log(f"⏩ Retomando envio: {ja_enviados} registros já enviados anteriormente foram pulados")
+
+    pendentes = (
+        (i, r) for i, r in enumerate(armazenamento.iterar_registros(tabela), start=1)
+        if reenviar or not r.get("enviado")
+    )
+
+    # Cada thread do pool mantém a sua própria sessão SMTP (ou caixa de saída).
+    local = threading.local()
+    sessoes = []
+    sessoes_lock = threading.Lock()
+
+    def sessao():
+        if not hasattr(local, "smtp"):
+            local.smtp = envio_email.criar_transporte(config_smtp, transporte)
+            with sessoes_lock:
+                sessoes.append(local.smtp)
+        return local.smtp
+
+    def processar(item):
+        i, registro = item
+        logs = []
+        destinatario = None
+        try:
+            envio = preparar(i, registro, remetente, logs)
+            if envio is None:
+                return registro, "pulados", logs, None
+
+            destinatario, msg = envio
+            sessao().enviar(destinatario, msg, referencia=(tabela, registro.get(chave)))
+
+            if transporte == "caixa_saida":
+                logs.append(f"📥 Gravado na caixa de saída para {destinatario}")
+            else:
+                logs.append(f"✅ Enviado com sucesso para {destinatario}")
+            return registro, "enviados", logs, {"enviado": True, "enviado_em": datetime.now().isoformat(), "erro": None}
+
+        except Exception as e:
+            logs.append(f"❌ Erro ao enviar para {destinatario or 'sem email'}: {str(e)}")
+            return registro, "erros", logs, {"erro": str(e)}
+
+    checkpoint = _Checkpoint(tabela)
+    try:
+        for registro, campo, logs, estado in em_ordem(processar, pendentes, trabalhadores):
+            if estado:
+                checkpoint.marcar(registro, estado)
+            job.contar(campo, logs)
+            metricas.incrementar("envio_emails_total", campanha=job.estado["tipo"], resultado=campo)
+    finally:
+        checkpoint.gravar()
+        for smtp in sessoes:
+            smtp.fechar()
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import bisect
+import threading
+from glob import glob
+from contextlib import contextmanager
+
+# Métricas no formato texto do Prometheus, servidas em /metrics.
+#
+# Cada processo acumula os valores em memória. Com vários workers do gunicorn, defina
+# METRICAS_DIR: uma thread de cada worker grava ali um retrato dos seus valores a cada
+# METRICAS_INTERVALO segundos e o /metrics de qualquer worker soma os retratos de todos.
+
+METRICAS_DIR = os.environ.get("METRICAS_DIR")
+METRICAS_INTERVALO = float(os.environ.get("METRICAS_INTERVALO", "5"))
+
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICAS = {
+    "http_requisicao_duracao_segundos": ("histogram", "Duração das requisições HTTP por rota, método e status"),
+    "armazenamento_duracao_segundos": ("histogram", "Duração das operações no banco por operação e coleção"),
+    "armazenamento_registros_total": ("counter", "Registros lidos ou gravados no banco por operação e coleção"),
+    "smtp_duracao_segundos": ("histogram", "Duração das etapas SMTP (conectar, starttls, login, enviar)"),
+    "smtp_erros_total": ("counter", "Falhas nas etapas SMTP"),
+    "envio_emails_total": ("counter", "Resultado por destinatário nos envios (enviados, pulados, erros)"),
+    "colecao_registros": ("gauge", "Registros atualmente em cada coleção"),
+    "app_inicializacao_segundos": ("gauge", "Tempo de carregamento do app no processo que respondeu"),
+}
+
+_valores = {}
+_lock = threading.Lock()
+# pid do processo que já tem a thread de retratos (depois de um fork, o filho inicia a sua).
+_pid_retratos = None
+
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+
+def incrementar(nome, valor=1, **rotulos):
+    with _lock:
+        chave = _chave(nome, rotulos)
+        _valores[chave] = _valores.get(chave, 0) + valor
+    _iniciar_retratos()
+
+
+def observar(nome, segundos, **rotulos):
+    with _lock:
+        chave = _chave(nome, rotulos)
+        histograma = _valores.get(chave)
+        if histograma is None:
+            histograma = _valores[chave] = {"buckets": [0] * (len(BUCKETS_PADRAO) + 1), "soma": 0.0, "contagem": 0}
+        histograma["buckets"][bisect.bisect_left(BUCKETS_PADRAO, segundos)] += 1
+        histograma["soma"] += segundos
+        histograma["contagem"] += 1
+    _iniciar_retratos()
+
+
+@contextmanager
+def medir(nome, erros=None, **rotulos):
+    # Observa a duração do bloco; se `erros` for informado, conta ali as exceções.
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if erros:
+            incrementar(erros, **rotulos)
+        raise
+    finally:
+        observar(nome, time.perf_counter() - inicio, **rotulos)
+
+
+def _arquivo_retrato(pid):
+    return os.path.join(METRICAS_DIR, f"metricas-{pid}.json")
+
+
+def _serializar():
+    with _lock:
+        return [[nome, list(rotulos), valor] for (nome, rotulos), valor in _valores.items()]
+
+
+def _gravar_retrato():
+    destino = _arquivo_retrato(os.getpid())
+    temporario = f"{destino}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(_serializar(), f)
+    os.replace(temporario, destino)
+
+
+def _iniciar_retratos():
+    global _pid_retratos
+    if not METRICAS_DIR or _pid_retratos == os.getpid():
+        return
+    with _lock:
+        if _pid_retratos == os.getpid():
+            return
+        _pid_retratos = os.getpid()
+
+    def gravar_periodicamente():
+        os.makedirs(METRICAS_DIR, exist_ok=True)
+        while True:
+            time.sleep(METRICAS_INTERVALO)
+            try:
+                _gravar_retrato()
+            except OSError as e:
+                print(f"⚠️ Não foi possível gravar o retrato das métricas: {e}")
+
+    threading.Thread(target=gravar_periodicamente, name="metricas-retrato", daemon=True).start()
+
+
+def _somar(total, nome, rotulos, valor):
+    chave = (nome, tuple(tuple(par) for par in rotulos))
+    atual = total.get(chave)
+    if atual is None:
+        total[chave] = json.loads(json.dumps(valor))
+    elif isinstance(valor, dict):
+        atual["buckets"] = [a + b for a, b in zip(atual["buckets"], valor["buckets"])]
+        atual["soma"] += valor["soma"]
+        atual["contagem"] += valor["contagem"]
+    else:
+        total[chave] = atual + valor
+
+
+def _coletar():
+    total = {}
+    for nome, rotulos, valor in _serializar():
+        _somar(total, nome, rotulos, valor)
+
+    if METRICAS_DIR:
+        proprio = _arquivo_retrato(os.getpid())
+        for caminho in glob(os.path.join(METRICAS_DIR, "metricas-*.json")):
+            if caminho == proprio:
+                continue
+            try:
+                with open(caminho, encoding="utf-8") as f:
+                    for nome, rotulos, valor in json.load(f):
+                        _somar(total, nome, rotulos, valor)
+            except (OSError, ValueError):
+                continue
+    return total
+
+
+def _rotulos(rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ""
+    texto = ",".join(
+        f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in pares
+    )
+    return "{" + texto + "}"
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def texto(medidas=()):
+    # `medidas` são valores calculados na hora da coleta: (nome, rotulos, valor).
+    total = _coletar()
+    for nome, rotulos, valor in medidas:
+        total[_chave(nome, rotulos)] = valor
+
+    linhas = []
+    for nome, (tipo, ajuda) in METRICAS.items():
+        series = sorted((rotulos, valor) for (n, rotulos), valor in total.items() if n == nome)
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+
+        for rotulos, valor in series:
+            if tipo != "histogram":
+                linhas.append(f"{nome}{_rotulos(rotulos)} {_numero(valor)}")
+                continue
+
+            acumulado = 0
+            for limite, quantidade in zip(BUCKETS_PADRAO + ("+Inf",), valor["buckets"]):
+                acumulado += quantidade
+                linhas.append(f"{nome}_bucket{_rotulos(rotulos, [('le', str(limite))])} {acumulado}")
+            linhas.append(f"{nome}_sum{_rotulos(rotulos)} {_numero(valor['soma'])}")
+            linhas.append(f"{nome}_count{_rotulos(rotulos)} {valor['contagem']}")
+
+    return "\n".join(linhas) + "\n"
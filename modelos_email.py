@@ -0,0 +1,55 @@
+import os
+import re
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+# Templates Jinja dos e-mails de cada campanha (templates/emails/<template>.html).
+# O Environment guarda o template compilado; o ModeloEmail vai além e renderiza as partes
+# fixas uma única vez por lote, deixando só os campos do destinatário para cada mensagem.
+
+PASTA_TEMPLATES_EMAIL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "emails")
+
+_ambiente = Environment(
+    loader=FileSystemLoader(PASTA_TEMPLATES_EMAIL),
+    autoescape=False,
+    undefined=StrictUndefined,
+)
+
+_MARCADOR = re.compile("\x00([A-Za-z_][A-Za-z0-9_]*)\x00")
+
+
+class ModeloEmail:
+    # `campos` são os nomes preenchidos por destinatário; eles entram no template como
+    # marcadores e, por isso, não podem passar por filtros Jinja (chegam já formatados).
+    # `fixos` são renderizados na criação do modelo e valem para o lote inteiro.
+
+    def __init__(self, template, assunto, campos, **fixos):
+        self.assunto = assunto
+        self.campos = tuple(campos)
+
+        marcadores = {campo: f"\x00{campo}\x00" for campo in self.campos}
+        renderizado = _ambiente.get_template(f"{template}.html").render(**fixos, **marcadores)
+
+        # Alterna texto fixo (posições pares) e nome do campo (posições ímpares).
+        self.partes = _MARCADOR.split(renderizado)
+
+    def renderizar(self, **valores):
+        partes = self.partes[:]
+        for i in range(1, len(partes), 2):
+            partes[i] = str(valores[partes[i]])
+        return "".join(partes)
+
+    def mensagem(self, remetente, destinatario, **valores):
+        msg = MIMEMultipart()
+        msg["From"] = f"The HR Key <{remetente}>"
+        msg["To"] = destinatario
+        msg["Subject"] = self.assunto
+        msg.attach(MIMEText(self.renderizar(**valores), "html"))
+        return msg
+
+
+def renderizar_template(template, **contexto):
+    # Renderização completa, sem o cache de partes fixas (usada no benchmark como referência).
+    return _ambiente.get_template(f"{template}.html").render(**contexto)
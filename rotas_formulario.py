@@ -0,0 +1,52 @@
+import unicodedata
+
+# Registro único das rotas dos formulários: (produto, tipo) normalizados -> URL base no
+# gestor. É usado pelo redirecionamento de finalizar_cadastro e pelo envio de e-mails, e
+# as chaves e a URL já resolvidas ficam gravadas no token desde a ingestão.
+
+URL_GESTOR = "https://gestor.thehrkey.tech"
+
+ROTAS_FORMULARIO = {
+    "arquetipos": {
+        "autoavaliacao": f"{URL_GESTOR}/form_arquetipos_autoaval",
+        "avaliacao equipe": f"{URL_GESTOR}/form_arquetipos",
+        "avaliacao de equipe": f"{URL_GESTOR}/form_arquetipos",
+    },
+    "microambiente": {
+        "microambiente_autoavaliacao": f"{URL_GESTOR}/microambiente-de-equipes",
+        "microambiente autoavaliacao": f"{URL_GESTOR}/microambiente-de-equipes",
+        "microambiente_equipe": f"{URL_GESTOR}/microambiente-de-equipes",
+        "microambiente equipe": f"{URL_GESTOR}/microambiente-de-equipes",
+    },
+}
+
+NOMES_PRODUTO = {"arquetipos": "arquétipos", "microambiente": "microambiente"}
+
+CAMPOS_ROTA = ("produto_chave", "tipo_chave", "url_base")
+
+
+def normalizar(texto):
+    return unicodedata.normalize('NFKD', str(texto)).encode('ASCII', 'ignore').decode('ASCII').strip().lower()
+
+
+def campos_rota(produto, tipo):
+    # Campos gravados no token na ingestão; url_base fica None se a combinação não tem rota.
+    produto_chave = normalizar(produto)
+    tipo_chave = normalizar(tipo)
+    url_base = ROTAS_FORMULARIO.get(produto_chave, {}).get(tipo_chave)
+    return {"produto_chave": produto_chave, "tipo_chave": tipo_chave, "url_base": url_base}
+
+
+def rota_do_registro(registro):
+    # Usa os campos gravados na ingestão; tokens antigos (sem eles) são normalizados aqui.
+    if "url_base" in registro:
+        return {campo: registro[campo] for campo in CAMPOS_ROTA}
+    return campos_rota(registro.get("produto", ""), registro.get("tipo", ""))
+
+
+def erro_rota(rota):
+    # (motivo, valor) para uma rota sem url_base.
+    produto = rota["produto_chave"]
+    if produto not in ROTAS_FORMULARIO:
+        return "produto inválido", produto
+    return f"tipo inválido para {NOMES_PRODUTO[produto]}", rota["tipo_chave"]
@@ -0,0 +1,128 @@
+import os
+import hmac
+import json
+import base64
+import hashlib
+import threading
+
+import armazenamento
+
+# Tokens LeaderTrack assinados: o próprio link carrega empresa, codrodada e emailLider, e a
+# validação confere só a assinatura HMAC, sem consultar o banco.
+#
+#   lt1.<id da chave>.<dados em base64url>.<assinatura>
+#
+# Ligado quando LEADERTRACK_CHAVES está definida, no formato "id:segredo,id2:segredo2".
+# Os links são assinados com LEADERTRACK_CHAVE_ATUAL (por padrão a primeira da lista) e
+# qualquer chave da lista continua valendo na validação, o que permite trocar de chave sem
+# invalidar os links já enviados. Tokens sem o prefixo seguem o caminho antigo (banco).
+#
+# Para desativar tokens individuais há o arquivo de revogados (um id de token por linha),
+# lido de novo só quando muda.
+
+PREFIXO = "lt1."
+
+# A assinatura HMAC-SHA256 é truncada em 16 bytes (128 bits) para o link ficar curto.
+TAMANHO_ASSINATURA = 16
+
+REVOGADOS_FILE = os.environ.get(
+    "LEADERTRACK_REVOGADOS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(armazenamento.DB_FILE)), "leader_track_revogados.txt"),
+)
+
+
+def _ler_chaves(texto):
+    chaves = {}
+    for item in (texto or "").split(","):
+        if not item.strip():
+            continue
+        kid, separador, segredo = item.strip().partition(":")
+        if not separador or not kid or not segredo or "." in kid:
+            raise ValueError(f"LEADERTRACK_CHAVES inválida: use id:segredo (id sem ponto), recebido {kid!r}")
+        chaves[kid] = segredo.encode("utf-8")
+    return chaves
+
+
+CHAVES = _ler_chaves(os.environ.get("LEADERTRACK_CHAVES"))
+CHAVE_ATUAL = os.environ.get("LEADERTRACK_CHAVE_ATUAL") or next(iter(CHAVES), None)
+if CHAVE_ATUAL is not None and CHAVE_ATUAL not in CHAVES:
+    raise ValueError(f"LEADERTRACK_CHAVE_ATUAL={CHAVE_ATUAL!r} não está em LEADERTRACK_CHAVES")
+
+_revogados = {"assinatura": None, "ids": frozenset()}
+_revogados_lock = threading.Lock()
+
+
+def habilitado():
+    return CHAVE_ATUAL is not None
+
+
+def eh_assinado(token):
+    return isinstance(token, str) and token.startswith(PREFIXO)
+
+
+def _b64(dados):
+    return base64.urlsafe_b64encode(dados).rstrip(b"=").decode("ascii")
+
+
+def _de_b64(texto):
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def _assinatura(kid, corpo):
+    return hmac.new(CHAVES[kid], corpo.encode("ascii"), hashlib.sha256).digest()[:TAMANHO_ASSINATURA]
+
+
+def assinar(registro):
+    # O id do token no banco vai junto, para que o link possa ser revogado individualmente.
+    dados = [registro.get("empresa", ""), registro.get("codrodada", ""), registro.get("emailLider", ""), registro["token"]]
+    carga = _b64(json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    corpo = f"{PREFIXO}{CHAVE_ATUAL}.{carga}"
+    return f"{corpo}.{_b64(_assinatura(CHAVE_ATUAL, corpo))}"
+
+
+def verificar(token):
+    # Devolve um registro no formato da coleção leader_track_tokens (ativo=False se revogado),
+    # ou None se o token está malformado, a chave é desconhecida ou a assinatura não confere.
+    try:
+        corpo, assinatura = token.rsplit(".", 1)
+        kid, carga = corpo[len(PREFIXO):].split(".")
+        if kid not in CHAVES or not hmac.compare_digest(_de_b64(assinatura), _assinatura(kid, corpo)):
+            return None
+        empresa, codrodada, email_lider, token_id = json.loads(_de_b64(carga))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+
+    return {
+        "token": token_id,
+        "empresa": empresa,
+        "codrodada": codrodada,
+        "emailLider": email_lider,
+        "ativo": token_id not in revogados(),
+    }
+
+
+def revogados():
+    try:
+        info = os.stat(REVOGADOS_FILE)
+        assinatura = (info.st_mtime_ns, info.st_size)
+    except FileNotFoundError:
+        return frozenset()
+
+    if _revogados["assinatura"] != assinatura:
+        with _revogados_lock:
+            if _revogados["assinatura"] != assinatura:
+                with open(REVOGADOS_FILE, encoding="utf-8") as f:
+                    _revogados["ids"] = frozenset(linha.strip() for linha in f if linha.strip())
+                _revogados["assinatura"] = assinatura
+    return _revogados["ids"]
+
+
+def revogar(ids):
+    # Acrescenta ao arquivo só os ids novos; cada linha é uma escrita em modo append.
+    novos = sorted(set(ids) - revogados())
+    if novos:
+        with open(REVOGADOS_FILE, "a", encoding="utf-8") as f:
+            f.write("".join(f"{token_id}\n" for token_id in novos))
+            f.flush()
+            os.fsync(f.fileno())
+    return novos